@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+
+import server
+
+
+async def recompute_stats(args):
+    result = await server.repair_sheet_stats(user_id=args.user, dry_run=args.dry_run)
+    action = "would repair" if args.dry_run else "repaired"
+    print(f"Checked {result['checked']} sheets, {action} {result['drifted']}")
+    for sheet_id in result['sheets']:
+        print(f"  {sheet_id}")
+
+
+async def rebuild_rollups(args):
+    await server.rebuild_rollups(user_id=args.user)
+    scope = f"user {args.user}" if args.user else "all users"
+    print(f"Rebuilt rollups for {scope}")
+
+
+async def overspend_report(args):
+    rows = await server.find_overspending(user_id=args.user, month=args.month)
+    for row in rows:
+        print(
+            f"{row['user_id']}  {row['month']}  {row['sheet_name']}  {row['category']}: "
+            f"spent {row['spent']:.2f} of {row['budget']:.2f} (over by {row['overspent']:.2f})"
+        )
+    print(f"{len(rows)} overspent budgets")
+
+
+async def migrate_datetimes(args):
+    converted = await server.migrate_datetimes(restart=args.restart)
+    for collection, count in converted.items():
+        print(f"{collection}: converted {count}")
+
+
+async def build_search_index(args):
+    indexed = await server.build_search_index(restart=args.restart)
+    print(f"Indexed {indexed} expenses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expense tracker maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("recompute-stats", help="Detect and fix drift in maintained sheet aggregates")
+    stats.add_argument("--user", help="Only check sheets belonging to this user id")
+    stats.add_argument("--dry-run", action="store_true", help="Report drift without writing")
+    stats.set_defaults(handler=recompute_stats)
+
+    rollups = commands.add_parser("rebuild-rollups", help="Recompute the monthly category rollups from expenses")
+    rollups.add_argument("--user", help="Only rebuild rollups for this user id")
+    rollups.set_defaults(handler=rebuild_rollups)
+
+    overspend = commands.add_parser("overspend-report", help="List budgets whose spending exceeds the allocation")
+    overspend.add_argument("--user", help="Only report sheets belonging to this user id")
+    overspend.add_argument("--month", help="Only report sheets for this month (YYYY-MM)")
+    overspend.set_defaults(handler=overspend_report)
+
+    datetimes = commands.add_parser("migrate-datetimes", help="Convert string timestamps and expense dates to BSON dates")
+    datetimes.add_argument("--restart", action="store_true", help="Rescan from the start instead of the saved checkpoint")
+    datetimes.set_defaults(handler=migrate_datetimes)
+
+    search = commands.add_parser("build-search-index", help="Index expenses written before the search index existed")
+    search.add_argument("--restart", action="store_true", help="Rescan from the start instead of the saved checkpoint")
+    search.set_defaults(handler=build_search_index)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(args.handler(args))
+    finally:
+        server.client.close()
+
+
+if __name__ == "__main__":
+    main()
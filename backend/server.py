@@ -1,32 +1,49 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, UploadFile, File, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, UpdateOne, ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError, field_validator
+from typing import List, Optional, Union
 import uuid
+import asyncio
+import base64
+import json
+import csv
+import io
+import re
+import hashlib
+import multiprocessing
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import orjson
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: stored datetimes are UTC and come back as aware datetimes
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # JWT configuration
@@ -34,20 +51,110 @@ SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# Authenticated user cache
+USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true'
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+
+# Per-user columnar expense cache behind the trend analytics, bounded by array bytes
+ANALYTICS_CACHE_MAX_BYTES = int(os.environ.get('ANALYTICS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Sheet change feed: events buffered per subscriber before a slow client is cut
+# off, and the interval of keepalive comments on an idle stream
+SHEET_EVENTS_QUEUE_SIZE = int(os.environ.get('SHEET_EVENTS_QUEUE_SIZE', '64'))
+SHEET_EVENTS_KEEPALIVE_SECONDS = float(os.environ.get('SHEET_EVENTS_KEEPALIVE_SECONDS', '15'))
+
+# Expense storage: "embedded" keeps expenses in the sheet document's array,
+# "collection" stores them in their own indexed `expenses` collection
+EXPENSE_STORAGE = os.environ.get('EXPENSE_STORAGE', 'embedded')
+if EXPENSE_STORAGE not in ('embedded', 'collection'):
+    raise RuntimeError(f"Unknown EXPENSE_STORAGE: {EXPENSE_STORAGE}")
+
+# Bulk import: rows are validated, deduplicated and written in batches of this size
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/max rounds pin the cost, so hashes made at any other cost are upgraded on login
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# Worker processes come from a forkserver (spawn where there is none) rather than
+# being forked from this process, which by then runs Motor's and the executors'
+# threads: a fork copies their locks in whatever state they are in at that moment.
+WORKER_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+# bcrypt runs on a worker pool so it never blocks the event loop. Requests beyond
+# the pool size queue up to PASSWORD_QUEUE_LIMIT, after which they get a fast 503.
+PASSWORD_POOL_KIND = os.environ.get('PASSWORD_POOL_KIND', 'thread')
+PASSWORD_POOL_SIZE = int(os.environ.get('PASSWORD_POOL_SIZE', '4'))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', '32'))
+if PASSWORD_POOL_KIND == 'process':
+    password_pool = ProcessPoolExecutor(max_workers=PASSWORD_POOL_SIZE, mp_context=WORKER_MP_CONTEXT)
+else:
+    password_pool = ThreadPoolExecutor(max_workers=PASSWORD_POOL_SIZE, thread_name_prefix="password")
+password_slots = asyncio.Semaphore(PASSWORD_POOL_SIZE)
+password_tasks_in_flight = 0
+
+# PDF rendering is CPU-bound ReportLab work, so it runs in worker processes.
+# Each user may have PDF_MAX_PER_USER renders in flight (429 beyond that) and
+# the whole server PDF_POOL_SIZE + PDF_QUEUE_LIMIT (503 beyond that).
+PDF_POOL_SIZE = int(os.environ.get('PDF_POOL_SIZE', '2'))
+PDF_QUEUE_LIMIT = int(os.environ.get('PDF_QUEUE_LIMIT', '8'))
+PDF_MAX_PER_USER = int(os.environ.get('PDF_MAX_PER_USER', '1'))
+pdf_pool = ProcessPoolExecutor(max_workers=PDF_POOL_SIZE, mp_context=WORKER_MP_CONTEXT)
+pdf_renders_in_flight = 0
+pdf_renders_by_user = {}
+
+# Rendered reports are cached on disk keyed by sheet id + updated_at. Bump
+# PDF_REPORT_VERSION whenever the report layout changes to retire old entries.
+PDF_REPORT_VERSION = 2
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', ROOT_DIR / 'pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Sheets with more transactions than this use the large-report layout, which
+# streams rows from MongoDB inside the worker and lays them out page by page
+PDF_LARGE_REPORT_THRESHOLD = int(os.environ.get('PDF_LARGE_REPORT_THRESHOLD', '1000'))
+LARGE_REPORT_ROW_HEIGHT = 14
 security = HTTPBearer()
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+# Timestamps are stored as BSON datetimes and expense dates as datetimes at
+# midnight UTC; the API keeps YYYY-MM-DD strings for expense dates. Documents
+# written before that hold ISO strings until migrate_datetimes reaches them,
+# so everything that reads these fields accepts either.
+def utc_now() -> datetime:
+    # BSON keeps milliseconds; truncating here makes what a write returns equal what a read gets
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def parse_expense_date(value: str) -> datetime:
+    return datetime.strptime(value.strip(), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+def format_expense_date(value) -> str:
+    return value.date().isoformat() if isinstance(value, datetime) else value
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: EmailStr
     name: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -73,7 +180,7 @@ class ExpenseItem(BaseModel):
 
 class Budget(BaseModel):
     category: str
-    allocated: float
+    allocated: float = Field(ge=0)
 
 class ExpenseSheet(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -84,20 +191,137 @@ class ExpenseSheet(BaseModel):
     monthly_salary: float = 0.0
     budgets: List[Budget] = []
     expenses: List[ExpenseItem] = []
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    revision: int = 0
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+
+class SheetSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    name: str
+    month: str
+    monthly_salary: float = 0.0
+    total: float = 0.0
+    count: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+class SheetSummaryPage(BaseModel):
+    items: List[SheetSummary]
+    next_cursor: Optional[str] = None
+
+def distinct_budgets(budgets: List[Budget]) -> List[Budget]:
+    if len({budget.category for budget in budgets}) != len(budgets):
+        raise ValueError("Each category can have only one budget")
+    return budgets
 
 class ExpenseSheetCreate(BaseModel):
     name: str
     month: str
-    monthly_salary: float
+    monthly_salary: float = 0.0
     budgets: List[Budget] = []
+    
+    _distinct_budgets = field_validator('budgets')(distinct_budgets)
+
+class BudgetUpdate(BaseModel):
+    # Replaces the sheet's budgets; monthly_salary is left alone when omitted
+    monthly_salary: Optional[float] = None
+    budgets: List[Budget]
+    
+    _distinct_budgets = field_validator('budgets')(distinct_budgets)
 
 class ExpenseItemCreate(BaseModel):
     date: str
     category: str
     description: str
     amount: float
+    
+    @field_validator('date')
+    @classmethod
+    def check_date(cls, value: str) -> str:
+        return parse_expense_date(value).date().isoformat()
+
+class ExpensePage(BaseModel):
+    items: List[ExpenseItem]
+    next_cursor: Optional[str] = None
+
+class SearchHit(BaseModel):
+    sheet_id: str
+    sheet_name: str
+    month: str
+    expense: ExpenseItem
+    score: int  # query words matched as whole words rather than only as prefixes
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+class ExpenseChange(BaseModel):
+    # Response of an expense mutation with view=delta: the affected expense
+    # and the sheet totals after the write
+    expense: ExpenseItem
+    deleted: bool = False
+    total: float
+    count: int
+    by_category: dict
+    overspent_categories: list
+    revision: int
+    updated_at: datetime
+
+class SheetViewExpense(BaseModel):
+    id: str
+    date: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    amount: Optional[float] = None
+
+class SheetViewStats(BaseModel):
+    total: Optional[float] = None
+    by_category: Optional[dict] = None
+    count: Optional[int] = None
+    remaining_budget: Optional[float] = None
+    total_budget: Optional[float] = None
+    overspent_categories: Optional[list] = None
+
+class SheetView(BaseModel):
+    # Response of GET /sheets/{id}/view. Only the fields asked for are sent, so
+    # everything but the ids is optional; next_cursor comes with expenses.
+    id: str
+    name: Optional[str] = None
+    month: Optional[str] = None
+    monthly_salary: Optional[float] = None
+    budgets: Optional[List[Budget]] = None
+    revision: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    expenses: Optional[List[SheetViewExpense]] = None
+    next_cursor: Optional[str] = None
+    stats: Optional[SheetViewStats] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResult(BaseModel):
+    """Outcome of a bulk insert or file import.
+
+    `errors[].row` counts rows the way their source does: from 1 by position in
+    the request array for bulk inserts, by line for CSV files (the header is
+    line 1, so data starts at 2), and from 1 by transaction for OFX statements.
+    """
+    imported: int
+    duplicates: int
+    failed: int
+    errors: List[ImportRowError]
+
+class OverspentCategory(BaseModel):
+    sheet_id: str
+    sheet_name: str
+    month: str
+    category: str
+    budget: float
+    spent: float
+    overspent: float
 
 class ExpenseStats(BaseModel):
     total: float
@@ -112,6 +336,353 @@ class ComparisonData(BaseModel):
     sheet2: ExpenseSheet
     comparison: dict
 
+class ComparisonSeries(BaseModel):
+    # One point per sheet; delta and percent_change are None for the first point
+    values: List[float]
+    delta: List[Optional[float]]
+    percent_change: List[Optional[float]]
+
+class SeriesComparison(BaseModel):
+    sheet_ids: List[str]
+    months: List[str]
+    counts: List[int]
+    total: ComparisonSeries
+    categories: dict[str, ComparisonSeries]
+    sheets: Optional[List[ExpenseSheet]] = None
+
+class RollupPeriod(BaseModel):
+    period: str  # YYYY-MM or YYYY
+    total: float
+    count: int
+    by_category: dict
+
+class RollupReport(BaseModel):
+    granularity: str
+    periods: List[RollupPeriod]
+    total: float
+    count: int
+    months: int
+    average_monthly: float
+
+class TrendPeriod(BaseModel):
+    period: str  # YYYY-MM-DD for a day or the Monday starting a week, YYYY-MM for a month
+    total: float
+    count: int
+    by_category: dict
+
+class TrendReport(BaseModel):
+    granularity: str
+    periods: List[TrendPeriod]
+    total: float
+    count: int
+
+class UserCache:
+    # LRU of User models keyed by the JWT subject, with a per-entry TTL.
+    # Anything that writes to a users document must call invalidate().
+    def __init__(self, max_size: int, ttl_seconds: float, enabled: bool = True):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id: str) -> Optional[User]:
+        if not self.enabled:
+            return None
+        
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, user: User):
+        if not self.enabled:
+            return
+        
+        self.entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+        self.entries.move_to_end(user.id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, user_id: str):
+        self.entries.pop(user_id, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, USER_CACHE_ENABLED)
+
+class PdfCache:
+    # Size-capped directory of rendered reports. A file's mtime is its last use,
+    # so eviction removes the least recently used files first. Safe to share
+    # between workers: writes are atomic renames and a missing file is a miss.
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+    
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.pdf"
+    
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            content = self.path(key).read_bytes()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+    
+    def put(self, key: str, content: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        temp_path.write_bytes(content)
+        os.replace(temp_path, self.path(key))
+        self.evict()
+    
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+def day_number(value) -> int:
+    # Days since 1970-01-01; -1 for an unmigrated date string that never parsed
+    if isinstance(value, str):
+        try:
+            value = parse_expense_date(value)
+        except ValueError:
+            return -1
+    return value.toordinal() - EPOCH_ORDINAL
+
+class ExpenseColumns:
+    # One user's expenses as parallel arrays: day number, category code (an index
+    # into `categories`) and amount in integer cents, so sums are exact. Each
+    # sheet's rows are contiguous; `spans` maps a sheet to its slice, which lets a
+    # rebuild reload only the sheets whose version changed.
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.data_version = None
+        self.categories = []
+        self.category_codes = {}
+        self.versions = {}
+        self.spans = {}
+        self.sheet_ids = []
+        self.sheet_index = np.empty(0, dtype=np.int32)
+        self.days = np.empty(0, dtype=np.int32)
+        self.codes = np.empty(0, dtype=np.int32)
+        self.cents = np.empty(0, dtype=np.int64)
+    
+    def encode(self, category: str) -> int:
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+    
+    def encode_expenses(self, expenses: list) -> tuple:
+        count = len(expenses)
+        return (
+            np.fromiter((day_number(e['date']) for e in expenses), dtype=np.int32, count=count),
+            np.fromiter((self.encode(e['category']) for e in expenses), dtype=np.int32, count=count),
+            np.rint(np.fromiter((e['amount'] for e in expenses), dtype=np.float64, count=count) * 100).astype(np.int64)
+        )
+    
+    def rebuild(self, versions: dict, loaded: dict):
+        # versions: {sheet_id: version} for every sheet the user has now;
+        # loaded: {sheet_id: expenses} for those whose cached rows are stale
+        blocks, spans, start = [], {}, 0
+        for sheet_id in versions:
+            if sheet_id in loaded:
+                block = self.encode_expenses(loaded[sheet_id])
+            else:
+                first, last = self.spans[sheet_id]
+                block = (self.days[first:last], self.codes[first:last], self.cents[first:last])
+            blocks.append(block)
+            spans[sheet_id] = (start, start + len(block[0]))
+            start += len(block[0])
+        
+        self.versions = dict(versions)
+        self.spans = spans
+        self.sheet_ids = list(versions)
+        self.sheet_index = np.repeat(np.arange(len(blocks), dtype=np.int32), [len(block[0]) for block in blocks])
+        self.days = np.concatenate([np.empty(0, dtype=np.int32)] + [block[0] for block in blocks])
+        self.codes = np.concatenate([np.empty(0, dtype=np.int32)] + [block[1] for block in blocks])
+        self.cents = np.concatenate([np.empty(0, dtype=np.int64)] + [block[2] for block in blocks])
+    
+    @property
+    def nbytes(self) -> int:
+        return self.sheet_index.nbytes + self.days.nbytes + self.codes.nbytes + self.cents.nbytes
+
+async def load_expense_columns(user_id: str, sheet_ids: list) -> dict:
+    # {sheet_id: [expense]} with only the fields the columns hold
+    loaded = {sheet_id: [] for sheet_id in sheet_ids}
+    if not sheet_ids:
+        return loaded
+    if EXPENSE_STORAGE == 'collection':
+        cursor = db.expenses.find(
+            {"user_id": user_id, "sheet_id": {"$in": sheet_ids}},
+            {"_id": 0, "sheet_id": 1, "date": 1, "category": 1, "amount": 1}
+        )
+        async for expense in cursor:
+            loaded[expense['sheet_id']].append(expense)
+    else:
+        cursor = db.expense_sheets.find(
+            {"user_id": user_id, "id": {"$in": sheet_ids}},
+            {"_id": 0, "id": 1, "expenses.date": 1, "expenses.category": 1, "expenses.amount": 1}
+        )
+        async for sheet in cursor:
+            loaded[sheet['id']] = sheet.get('expenses', [])
+    return loaded
+
+class ExpenseColumnCache:
+    # LRU of ExpenseColumns keyed by user id, bounded by the total size of their
+    # arrays. Every lookup re-reads the user's data_version, one point read, so
+    # writes from any worker are seen; only when it has moved are the sheet
+    # versions read (header-only) and the changed sheets reloaded.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, user_id: str) -> ExpenseColumns:
+        columns = self.entries.get(user_id)
+        if columns is None:
+            columns = self.entries[user_id] = ExpenseColumns()
+        
+        async with columns.lock:
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "data_version": 1})
+            data_version = (user or {}).get('data_version', 0)
+            if columns.data_version == data_version:
+                self.hits += 1
+                return self.touch(user_id, columns)
+            
+            # data_version was read before the sheets, so a write landing in between
+            # leaves it behind and is picked up on the next lookup
+            sheets = await db.expense_sheets.find(
+                {"user_id": user_id}, SHEET_VERSION_PROJECTION
+            ).sort([("created_at", 1), ("id", 1)]).to_list(None)
+            versions = {sheet['id']: (sheet.get('revision', 0), sheet['updated_at']) for sheet in sheets}
+            stale = [sheet_id for sheet_id, version in versions.items() if columns.versions.get(sheet_id) != version]
+            if stale or len(versions) != len(columns.versions):
+                self.misses += 1
+                columns.rebuild(versions, await load_expense_columns(user_id, stale))
+            else:
+                self.hits += 1
+            columns.data_version = data_version
+        return self.touch(user_id, columns)
+    
+    def touch(self, user_id: str, columns: ExpenseColumns) -> ExpenseColumns:
+        if user_id in self.entries:
+            self.entries.move_to_end(user_id)
+        self.evict()
+        return columns
+    
+    def evict(self):
+        # The most recently used entry is kept even if it alone exceeds the budget
+        total = sum(columns.nbytes for columns in self.entries.values())
+        while total > self.max_bytes and len(self.entries) > 1:
+            _, columns = self.entries.popitem(last=False)
+            total -= columns.nbytes
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "bytes": sum(columns.nbytes for columns in self.entries.values()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+expense_columns = ExpenseColumnCache(ANALYTICS_CACHE_MAX_BYTES)
+
+class SheetEventHub:
+    # In-process pub/sub for the sheet change feed. Writers never wait on
+    # readers: each subscriber has a bounded queue, and one that falls a full
+    # queue behind is dropped with a final `resync` event so the client reloads
+    # the sheet instead of the server buffering for it. Events only reach
+    # subscribers in this process; with several workers, replace publish() with
+    # a broker that calls deliver() on every worker.
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.published = 0
+        self.dropped = 0
+    
+    def subscribe(self, sheet_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(sheet_id, set()).add(queue)
+        return queue
+    
+    def unsubscribe(self, sheet_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(sheet_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[sheet_id]
+    
+    def deliver(self, sheet_id: str, event: dict):
+        for queue in list(self.subscribers.get(sheet_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Whatever is still queued is superseded by the reload
+                self.dropped += 1
+                self.unsubscribe(sheet_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync", "data": {}})
+    
+    async def publish(self, sheet_id: str, event_type: str, data: dict):
+        self.published += 1
+        self.deliver(sheet_id, {"type": event_type, "data": data})
+    
+    def stats(self) -> dict:
+        return {
+            "sheets": len(self.subscribers),
+            "subscribers": sum(len(queues) for queues in self.subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+sheet_events = SheetEventHub(SHEET_EVENTS_QUEUE_SIZE)
+
 # Helper functions
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -119,6 +690,26 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    # Returns (valid, new_hash); new_hash is set when the stored hash uses stale parameters
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def run_password_task(func, *args):
+    global password_tasks_in_flight
+    if password_tasks_in_flight >= PASSWORD_POOL_SIZE + PASSWORD_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    
+    password_tasks_in_flight += 1
+    try:
+        async with password_slots:
+            return await asyncio.get_running_loop().run_in_executor(password_pool, func, *args)
+    finally:
+        password_tasks_in_flight -= 1
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
@@ -126,6 +717,1397 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Expense storage helpers
+EXPENSE_PROJECTION = {"_id": 0, "user_id": 0}
+
+async def attach_expenses(sheets: list) -> list:
+    if EXPENSE_STORAGE == 'embedded' or not sheets:
+        return sheets
+    
+    by_sheet = {sheet['id']: [] for sheet in sheets}
+    cursor = db.expenses.find(
+        {"user_id": sheets[0]['user_id'], "sheet_id": {"$in": list(by_sheet)}},
+        EXPENSE_PROJECTION
+    ).sort([("sheet_id", 1), ("date", 1), ("id", 1)])
+    async for expense in cursor:
+        by_sheet[expense.pop('sheet_id')].append(expense)
+    
+    for sheet in sheets:
+        sheet['expenses'] = by_sheet[sheet['id']]
+    return sheets
+
+# Maintained sheet aggregates live under `stats` on the sheet document:
+# {"total", "count", "by_category": {<key>: {"total", "count"}}}. Category names
+# are free-form, so they are escaped before being used in a dotted update path.
+# "" would be an empty path segment and becomes '%00', which no other category
+# can encode to since '%' itself is escaped.
+def category_key(category: str) -> str:
+    if category == '':
+        return '%00'
+    return category.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+def category_name(key: str) -> str:
+    if key == '%00':
+        return ''
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+def empty_stats() -> dict:
+    return {"total": 0.0, "count": 0, "by_category": {}}
+
+def stats_delta(*changes) -> dict:
+    # Builds one $inc document from (expense, sign) pairs, e.g. (old, -1), (new, 1)
+    delta = {}
+    for expense, sign in changes:
+        key = category_key(expense['category'])
+        for path, value in (
+            ("stats.total", expense['amount'] * sign),
+            ("stats.count", sign),
+            (f"stats.by_category.{key}.total", expense['amount'] * sign),
+            (f"stats.by_category.{key}.count", sign),
+        ):
+            delta[path] = delta.get(path, 0) + value
+    return delta
+
+def read_stats(sheet: dict):
+    # Returns (total, by_category, count) from the maintained aggregates
+    stats = sheet.get('stats') or empty_stats()
+    by_category = {
+        category_name(key): entry['total']
+        for key, entry in stats['by_category'].items()
+        if entry['count'] > 0
+    }
+    return stats['total'], by_category, stats['count']
+
+# Budgets are stored twice: `budgets` in the API's shape, and stats.budgets as
+# {category key: allocated}, keyed like stats.by_category. Every expense write
+# already keeps the spent side current, so overspending is a comparison of two
+# maintained numbers and never a re-sum of expenses.
+def budget_allocations(budgets: list) -> dict:
+    return {category_key(budget['category']): budget['allocated'] for budget in budgets}
+
+def overspent_categories(stats: dict, allocations: dict) -> list:
+    overspent = []
+    for key, allocated in allocations.items():
+        entry = stats['by_category'].get(key)
+        if entry and entry['count'] > 0 and entry['total'] > allocated:
+            overspent.append({
+                'category': category_name(key),
+                'budget': allocated,
+                'spent': entry['total'],
+                'overspent': entry['total'] - allocated
+            })
+    return overspent
+
+async def find_overspending(user_id: Optional[str] = None, month: Optional[str] = None) -> list:
+    # One aggregation over every matching sheet that has budgets, pairing each
+    # allocation with its maintained spend; worst overspend first within a sheet
+    query = {"stats.budgets": {"$exists": True, "$ne": {}}}
+    if user_id:
+        query["user_id"] = user_id
+    if month:
+        query["month"] = month
+    pipeline = [
+        {"$match": query},
+        {"$project": {
+            "_id": 0, "user_id": 1, "sheet_id": "$id", "sheet_name": "$name", "month": 1,
+            "spending": {"$objectToArray": "$stats.by_category"},
+            "budget": {"$objectToArray": "$stats.budgets"}
+        }},
+        {"$unwind": "$budget"},
+        {"$project": {
+            "user_id": 1, "sheet_id": 1, "sheet_name": 1, "month": 1,
+            "key": "$budget.k",
+            "budget": "$budget.v",
+            "spent": {"$arrayElemAt": [
+                {"$filter": {
+                    "input": "$spending",
+                    "cond": {"$and": [{"$eq": ["$$this.k", "$budget.k"]}, {"$gt": ["$$this.v.count", 0]}]}
+                }},
+                0
+            ]}
+        }},
+        {"$project": {
+            "user_id": 1, "sheet_id": 1, "sheet_name": 1, "month": 1, "key": 1, "budget": 1,
+            "spent": {"$ifNull": ["$spent.v.total", 0]}
+        }},
+        {"$match": {"$expr": {"$gt": ["$spent", "$budget"]}}},
+        {"$addFields": {"overspent": {"$subtract": ["$spent", "$budget"]}}},
+        {"$sort": {"user_id": 1, "month": -1, "sheet_id": 1, "overspent": -1}}
+    ]
+    rows = await db.expense_sheets.aggregate(pipeline).to_list(None)
+    for row in rows:
+        row['category'] = category_name(row.pop('key'))
+    return rows
+
+# Cross-sheet rollups: one document per (user_id, month, category) in `rollups`,
+# keyed by the owning sheet's month. Kept in step with the sheet stats by every
+# expense mutation; rebuild_rollups recomputes them from the expenses.
+def rollup_deltas(*changes) -> dict:
+    # {category: (total, count)} from (expense, sign) pairs, like stats_delta
+    deltas = {}
+    for expense, sign in changes:
+        total, count = deltas.get(expense['category'], (0.0, 0))
+        deltas[expense['category']] = (total + expense['amount'] * sign, count + sign)
+    return deltas
+
+async def apply_rollups(sheet: dict, deltas: dict):
+    updates = [
+        UpdateOne(
+            {"user_id": sheet['user_id'], "month": sheet['month'], "category": category},
+            {"$inc": {"total": total, "count": count}},
+            upsert=True
+        )
+        for category, (total, count) in deltas.items()
+        if total or count
+    ]
+    if updates:
+        await db.rollups.bulk_write(updates, ordered=False)
+
+def expense_hash(expense: dict) -> str:
+    # Content hash used to recognise the same transaction imported twice
+    content = f"{format_expense_date(expense['date']).strip()}|{float(expense['amount']):.2f}|{expense['description'].strip().lower()}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+# Search index. `expense_search` holds one small entry per expense in either
+# storage layout, {user_id, sheet_id, expense_id, date, terms}, so the expenses
+# themselves (and an embedded sheet's array) carry no search data. terms are the
+# lowercased words of the description and category as "=word" plus every prefix
+# of two or more characters: a multikey index answers type-ahead queries with
+# equality lookups, and the "=word" entries let whole words rank above prefixes.
+SEARCH_WORD = re.compile(r'\w+')
+SEARCH_MAX_WORD_LENGTH = 20
+
+def search_words(text: str) -> list:
+    words = []
+    for word in SEARCH_WORD.findall(text.lower()):
+        word = word[:SEARCH_MAX_WORD_LENGTH]
+        if len(word) >= 2 and word not in words:
+            words.append(word)
+    return words
+
+def search_terms(expense: dict) -> list:
+    terms = set()
+    for word in search_words(f"{expense['description']} {expense['category']}"):
+        terms.add(f"={word}")
+        terms.update(word[:end] for end in range(2, len(word) + 1))
+    return sorted(terms)
+
+def search_entry(user_id: str, sheet_id: str, expense: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "sheet_id": sheet_id,
+        "expense_id": expense['id'],
+        "date": expense['date'],
+        "terms": search_terms(expense)
+    }
+
+async def index_expenses(user_id: str, sheet_id: str, expenses: list):
+    # Written after the expense itself; until then the expense is just not found
+    if expenses:
+        await db.expense_search.bulk_write([
+            ReplaceOne(
+                {"user_id": user_id, "sheet_id": sheet_id, "expense_id": expense['id']},
+                search_entry(user_id, sheet_id, expense),
+                upsert=True
+            )
+            for expense in expenses
+        ], ordered=False)
+
+async def unindex_expenses(user_id: str, sheet_id: str, expense_ids: Optional[list] = None):
+    query = {"user_id": user_id, "sheet_id": sheet_id}
+    if expense_ids is not None:
+        query["expense_id"] = {"$in": expense_ids}
+    await db.expense_search.delete_many(query)
+
+def stored_expense(expense: dict) -> dict:
+    # An API-shaped expense as it is written to MongoDB
+    return {**expense, "date": parse_expense_date(expense['date']), "content_hash": expense_hash(expense)}
+
+# Every write to a sheet or its expenses bumps the sheet's `revision`. Clients can
+# pin a write to the revision they last saw with If-Match: "<revision>", or echo
+# the ETag of GET /sheets/{id}; if the sheet has moved on since, the write is
+# refused with 409 instead of being applied.
+SHEET_ETAG = re.compile(r'(?:W/)?"[0-9a-f]{20}"')
+
+def expected_revision(if_match: Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == '*':
+        return None
+    try:
+        return int(if_match.strip().removeprefix('W/').strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail='If-Match must be a sheet revision, e.g. "3", or the sheet\'s ETag')
+
+async def if_match_revision(sheet_id: str, user_id: str, if_match: Optional[str]) -> Optional[int]:
+    # An ETag names a version, not a revision: read the sheet's header to find out
+    # which revision it is. The write itself is still pinned to that revision, so a
+    # write landing in between is caught there.
+    if if_match is None or not SHEET_ETAG.fullmatch(if_match.strip()):
+        return expected_revision(if_match)
+    version = await db.expense_sheets.find_one({"id": sheet_id, "user_id": user_id}, SHEET_VERSION_PROJECTION)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    if not etag_matches(if_match, sheets_etag("sheet", [version])):
+        raise HTTPException(status_code=409, detail="Sheet was modified by another request")
+    return version.get('revision', 0)
+
+async def revision_conflict(sheet_id: str, user_id: str) -> HTTPException:
+    # Called after a revision-pinned write matched nothing: a missing sheet is still a 404
+    if await db.expense_sheets.find_one({"id": sheet_id, "user_id": user_id}, {"_id": 1}) is None:
+        return HTTPException(status_code=404, detail="Sheet not found")
+    return HTTPException(status_code=409, detail="Sheet was modified by another request")
+
+async def claim_revision(sheet_id: str, user_id: str, expense_id: str, revision: Optional[int]) -> bool:
+    # Collection mode touches two documents per write, so a pinned write first moves
+    # the sheet off the expected revision; a concurrent writer then fails its own claim.
+    # The claim is the write's only revision bump, and is only taken once the expense
+    # is known to exist, so a write that ends in 404 leaves the revision alone.
+    # Returns False if there is no such expense.
+    if revision is None:
+        return True
+    if await db.expenses.find_one({"user_id": user_id, "sheet_id": sheet_id, "id": expense_id}, {"_id": 1}) is None:
+        return False
+    claimed = await db.expense_sheets.find_one_and_update(
+        {"id": sheet_id, "user_id": user_id, "revision": revision},
+        {"$inc": {"revision": 1}},
+        projection={"_id": 1}
+    )
+    if claimed is None:
+        raise await revision_conflict(sheet_id, user_id)
+    return True
+
+async def bump_data_version(user_id: str):
+    # Called after every write that adds, changes or removes a user's expenses or
+    # sheets, so caches built from them can tell with one read that they are stale
+    await db.users.update_one({"id": user_id}, {"$inc": {"data_version": 1}})
+
+# Single-expense mutations write through find-and-modify, scoped to the owner, and
+# return the sheet as it is after the write (shaped by `projection`, which must
+# include user_id and month for the rollups), or None if nothing matched.
+async def insert_expense(
+    sheet_id: str, user_id: str, expense: dict, projection: dict, revision: Optional[int] = None
+) -> Optional[dict]:
+    expense = stored_expense(expense)
+    update = {
+        "$set": {"updated_at": utc_now()},
+        "$inc": {"revision": 1, **stats_delta((expense, 1))}
+    }
+    if EXPENSE_STORAGE == 'embedded':
+        update["$push"] = {"expenses": expense}
+    query = {"id": sheet_id, "user_id": user_id}
+    if revision is not None:
+        query["revision"] = revision
+    sheet = await db.expense_sheets.find_one_and_update(
+        query, update, projection=projection, return_document=ReturnDocument.AFTER
+    )
+    if sheet is None:
+        if revision is not None:
+            raise await revision_conflict(sheet_id, user_id)
+        return None
+    
+    if EXPENSE_STORAGE == 'collection':
+        await db.expenses.insert_one({**expense, "user_id": user_id, "sheet_id": sheet_id})
+    await apply_rollups(sheet, rollup_deltas((expense, 1)))
+    await index_expenses(user_id, sheet_id, [expense])
+    await bump_data_version(user_id)
+    return sheet
+
+async def insert_expenses(sheet: dict, expenses: list):
+    # One write for the whole batch; stats are bumped with a single combined $inc
+    expenses = [stored_expense(expense) for expense in expenses]
+    delta = stats_delta(*((expense, 1) for expense in expenses))
+    if EXPENSE_STORAGE == 'embedded':
+        await db.expense_sheets.update_one(
+            {"id": sheet['id']},
+            {
+                "$push": {"expenses": {"$each": expenses}},
+                "$set": {"updated_at": utc_now()},
+                "$inc": {"revision": 1, **delta}
+            }
+        )
+    else:
+        await db.expenses.insert_many(
+            [{**expense, "user_id": sheet['user_id'], "sheet_id": sheet['id']} for expense in expenses],
+            ordered=False
+        )
+        await db.expense_sheets.update_one(
+            {"id": sheet['id']},
+            {
+                "$set": {"updated_at": utc_now()},
+                "$inc": {"revision": 1, **delta}
+            }
+        )
+    await apply_rollups(sheet, rollup_deltas(*((expense, 1) for expense in expenses)))
+    await index_expenses(sheet['user_id'], sheet['id'], expenses)
+    await bump_data_version(sheet['user_id'])
+
+async def existing_hashes(sheet: dict, hashes: list) -> set:
+    if EXPENSE_STORAGE == 'embedded':
+        pipeline = [
+            {"$match": {"id": sheet['id'], "user_id": sheet['user_id']}},
+            {"$unwind": "$expenses"},
+            {"$match": {"expenses.content_hash": {"$in": hashes}}},
+            {"$project": {"_id": 0, "content_hash": "$expenses.content_hash"}}
+        ]
+        cursor = db.expense_sheets.aggregate(pipeline)
+    else:
+        cursor = db.expenses.find(
+            {"user_id": sheet['user_id'], "sheet_id": sheet['id'], "content_hash": {"$in": hashes}},
+            {"_id": 0, "content_hash": 1}
+        )
+    return {doc['content_hash'] async for doc in cursor}
+
+async def find_embedded_expense(sheet_id: str, user_id: str, expense_id: str):
+    # Returns (sheet revision, expense) without loading the rest of the array. The
+    # revision is None on a sheet that has none yet, which a guard on it still matches.
+    sheet = await db.expense_sheets.find_one(
+        {"id": sheet_id, "user_id": user_id},
+        {"_id": 0, "revision": 1, "expenses": {"$elemMatch": {"id": expense_id}}}
+    )
+    if not sheet or not sheet.get('expenses'):
+        return None, None
+    return sheet.get('revision'), sheet['expenses'][0]
+
+EMBEDDED_WRITE_ATTEMPTS = 5
+
+async def modify_embedded_expense(sheet_id: str, user_id: str, expense_id: str, update, projection: dict,
+                                  revision: Optional[int]):
+    # Reads the element, then writes only if the sheet is still at the revision read,
+    # so the $inc built from the old element is exact. `update` maps the old element
+    # to the update document. An unpinned write that loses a race reads again, up to
+    # EMBEDDED_WRITE_ATTEMPTS times before giving up with 503; a pinned one gets 409.
+    # Returns (sheet, old element), or None if there is no element.
+    for _ in range(EMBEDDED_WRITE_ATTEMPTS):
+        current, previous = await find_embedded_expense(sheet_id, user_id, expense_id)
+        if previous is None:
+            return None
+        if revision is not None and (current or 0) != revision:
+            raise HTTPException(status_code=409, detail="Sheet was modified by another request")
+        sheet = await db.expense_sheets.find_one_and_update(
+            {"id": sheet_id, "user_id": user_id, "revision": current, "expenses.id": expense_id},
+            update(previous),
+            projection=projection, return_document=ReturnDocument.AFTER
+        )
+        if sheet is not None:
+            return sheet, previous
+        if revision is not None:
+            raise await revision_conflict(sheet_id, user_id)
+    raise HTTPException(
+        status_code=503,
+        detail="Sheet is being modified by other requests, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+async def replace_expense(sheet_id: str, user_id: str, expense_id: str, values: dict, projection: dict,
+                          revision: Optional[int] = None):
+    # Returns (sheet, expense) after the write, or None if the expense does not exist
+    values = stored_expense(values)
+    now = utc_now()
+    if EXPENSE_STORAGE == 'embedded':
+        # Positional $set: only the matched element is rewritten, whatever the sheet size
+        result = await modify_embedded_expense(sheet_id, user_id, expense_id, lambda previous: {
+            "$set": {**{f"expenses.$.{field}": value for field, value in values.items()}, "updated_at": now},
+            "$inc": {"revision": 1, **stats_delta((previous, -1), (values, 1))}
+        }, projection, revision)
+        if result is None:
+            return None
+        sheet, previous = result
+    else:
+        if not await claim_revision(sheet_id, user_id, expense_id, revision):
+            return None
+        previous = await db.expenses.find_one_and_update(
+            {"user_id": user_id, "sheet_id": sheet_id, "id": expense_id},
+            {"$set": values},
+            projection={"_id": 0, "user_id": 0, "sheet_id": 0}
+        )
+        if previous is None:
+            return None
+        # A pinned write already bumped the revision when it claimed it
+        sheet = await db.expense_sheets.find_one_and_update(
+            {"id": sheet_id, "user_id": user_id},
+            {
+                "$set": {"updated_at": now},
+                "$inc": {"revision": 0 if revision is not None else 1, **stats_delta((previous, -1), (values, 1))}
+            },
+            projection=projection, return_document=ReturnDocument.AFTER
+        )
+        if sheet is None:
+            return None  # Sheet deleted concurrently
+    
+    await apply_rollups(sheet, rollup_deltas((previous, -1), (values, 1)))
+    await index_expenses(user_id, sheet_id, [{**previous, **values}])
+    await bump_data_version(user_id)
+    return sheet, {**previous, **values}
+
+async def remove_expense(sheet_id: str, user_id: str, expense_id: str, projection: dict,
+                         revision: Optional[int] = None):
+    # Returns (sheet, removed expense) after the write, or None if there was nothing to remove
+    now = utc_now()
+    if EXPENSE_STORAGE == 'embedded':
+        result = await modify_embedded_expense(sheet_id, user_id, expense_id, lambda removed: {
+            "$pull": {"expenses": {"id": expense_id}},
+            "$set": {"updated_at": now},
+            "$inc": {"revision": 1, **stats_delta((removed, -1))}
+        }, projection, revision)
+        if result is None:
+            return None
+        sheet, removed = result
+    else:
+        if not await claim_revision(sheet_id, user_id, expense_id, revision):
+            return None
+        removed = await db.expenses.find_one_and_delete(
+            {"user_id": user_id, "sheet_id": sheet_id, "id": expense_id},
+            projection={"_id": 0, "user_id": 0, "sheet_id": 0}
+        )
+        if removed is None:
+            return None
+        sheet = await db.expense_sheets.find_one_and_update(
+            {"id": sheet_id, "user_id": user_id},
+            {
+                "$set": {"updated_at": now},
+                "$inc": {"revision": 0 if revision is not None else 1, **stats_delta((removed, -1))}
+            },
+            projection=projection, return_document=ReturnDocument.AFTER
+        )
+        if sheet is None:
+            return None  # Sheet deleted concurrently
+    
+    await apply_rollups(sheet, rollup_deltas((removed, -1)))
+    await unindex_expenses(user_id, sheet_id, [expense_id])
+    await bump_data_version(user_id)
+    return sheet, removed
+
+def stats_drifted(stored: Optional[dict], actual: dict) -> bool:
+    if stored is None or stored['count'] != actual['count'] or abs(stored['total'] - actual['total']) > 0.005:
+        return True
+    
+    live = {key: entry for key, entry in stored['by_category'].items() if entry['count'] > 0}
+    if live.keys() != actual['by_category'].keys():
+        return True
+    return any(
+        live[key]['count'] != entry['count'] or abs(live[key]['total'] - entry['total']) > 0.005
+        for key, entry in actual['by_category'].items()
+    )
+
+async def aggregate_sheet_stats(user_id: str, sheet_ids: list, source: Optional[str] = None) -> dict:
+    # Sums expenses inside MongoDB; only one row per (sheet, category) comes back
+    source = source or EXPENSE_STORAGE
+    if source == 'embedded':
+        collection = db.expense_sheets
+        pipeline = [
+            {"$match": {"user_id": user_id, "id": {"$in": sheet_ids}}},
+            {"$unwind": "$expenses"},
+            {"$group": {
+                "_id": {"sheet": "$id", "category": "$expenses.category"},
+                "total": {"$sum": "$expenses.amount"},
+                "count": {"$sum": 1}
+            }}
+        ]
+    else:
+        collection = db.expenses
+        pipeline = [
+            {"$match": {"user_id": user_id, "sheet_id": {"$in": sheet_ids}}},
+            {"$group": {
+                "_id": {"sheet": "$sheet_id", "category": "$category"},
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1}
+            }}
+        ]
+    
+    result = {sheet_id: empty_stats() for sheet_id in sheet_ids}
+    async for row in collection.aggregate(pipeline):
+        stats = result[row['_id']['sheet']]
+        stats['by_category'][category_key(row['_id']['category'])] = {"total": row['total'], "count": row['count']}
+        stats['total'] += row['total']
+        stats['count'] += row['count']
+    return result
+
+async def load_sheet_stats(sheets: list) -> dict:
+    # Shared by stats, comparison and PDF: {sheet_id: (total, by_category, count)}.
+    # Maintained aggregates are used as-is; sheets without them are aggregated.
+    missing = [sheet['id'] for sheet in sheets if sheet.get('stats') is None]
+    if missing:
+        aggregated = await aggregate_sheet_stats(sheets[0]['user_id'], missing)
+        for sheet in sheets:
+            if sheet['id'] in aggregated:
+                sheet['stats'] = aggregated[sheet['id']]
+    return {sheet['id']: read_stats(sheet) for sheet in sheets}
+
+# Stats repair, and with it the stats backfill migration, works through sheets in batches
+STATS_REPAIR_BATCH_SIZE = int(os.environ.get('STATS_REPAIR_BATCH_SIZE', '200'))
+
+async def recompute_sheet_stats(sheets: list, dry_run: bool = False) -> list:
+    # Returns (drifted, stats) per sheet, in order. A sheet that still carries an
+    # embedded array (before or mid-migration) is summed from that array. Sheets
+    # are aggregated together per user and source, and written in one bulk write.
+    groups = {}
+    for sheet in sheets:
+        source = 'embedded' if sheet.get('expenses') else EXPENSE_STORAGE
+        groups.setdefault((sheet['user_id'], source), []).append(sheet['id'])
+    actual = {}
+    for (user_id, source), sheet_ids in groups.items():
+        actual.update(await aggregate_sheet_stats(user_id, sheet_ids, source))
+    
+    results = [(stats_drifted(sheet.get('stats'), actual[sheet['id']]), actual[sheet['id']]) for sheet in sheets]
+    # Field by field so stats.budgets survives; skip the write if a mutation
+    # landed while we were summing
+    updates = [
+        UpdateOne(
+            {"id": sheet['id'], "updated_at": sheet['updated_at']},
+            {"$set": {"stats": stats} if sheet.get('stats') is None else {
+                f"stats.{field}": value for field, value in stats.items()
+            }}
+        )
+        for sheet, (drifted, stats) in zip(sheets, results)
+        if drifted
+    ]
+    if updates and not dry_run:
+        await db.expense_sheets.bulk_write(updates, ordered=False)
+    return results
+
+async def repair_sheet_stats(user_id: Optional[str] = None, dry_run: bool = False) -> dict:
+    result = {"checked": 0, "drifted": 0, "sheets": []}
+    query = {"user_id": user_id} if user_id else {}
+    # The one-element slice is enough to tell whether an embedded array is still populated
+    projection = {"_id": 1, "id": 1, "user_id": 1, "stats": 1, "updated_at": 1, "expenses": {"$slice": 1}}
+    last_id = None
+    while True:
+        page = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        batch = await db.expense_sheets.find(page, projection).sort("_id", 1).limit(
+            STATS_REPAIR_BATCH_SIZE
+        ).to_list(STATS_REPAIR_BATCH_SIZE)
+        if not batch:
+            break
+        for sheet, (drifted, _) in zip(batch, await recompute_sheet_stats(batch, dry_run)):
+            result['checked'] += 1
+            if drifted:
+                result['drifted'] += 1
+                result['sheets'].append(sheet['id'])
+        last_id = batch[-1]['_id']
+    return result
+
+async def backfill_sheet_stats():
+    await repair_sheet_stats()
+
+async def ensure_expense_indexes():
+    await db.expenses.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("date", 1), ("id", 1)],
+        unique=True, name="user_sheet_date_id"
+    )
+    await db.expenses.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("id", 1)],
+        unique=True, name="user_sheet_id"
+    )
+
+async def migrate_embedded_expenses() -> int:
+    # One-shot move of embedded arrays into the expenses collection. Items are
+    # upserted before the array is cleared, so an interrupted run can be resumed.
+    migrated = 0
+    cursor = db.expense_sheets.find(
+        {"expenses.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "user_id": 1, "expenses": 1}
+    )
+    async for sheet in cursor:
+        for expense in sheet['expenses']:
+            await db.expenses.replace_one(
+                {"user_id": sheet['user_id'], "sheet_id": sheet['id'], "id": expense['id']},
+                {**expense, "user_id": sheet['user_id'], "sheet_id": sheet['id']},
+                upsert=True
+            )
+        await db.expense_sheets.update_one({"id": sheet['id']}, {"$set": {"expenses": []}})
+        migrated += len(sheet['expenses'])
+    return migrated
+
+# Schema bootstrap
+# Each migration must be idempotent. Its version is recorded as pending before
+# it runs and committed after, so a crash mid-migration is visible on restart.
+# The worker applying it renews heartbeat_at while it runs; others wait until
+# the heartbeat is older than the lease before presuming the worker died.
+SCHEMA_MIGRATION_LEASE_SECONDS = int(os.environ.get('SCHEMA_MIGRATION_LEASE_SECONDS', '300'))
+SCHEMA_MIGRATION_HEARTBEAT_SECONDS = SCHEMA_MIGRATION_LEASE_SECONDS / 10
+
+async def create_user_indexes():
+    await db.users.create_index("email", unique=True, name="email_unique")
+    await db.users.create_index("id", unique=True, name="id_unique")
+
+async def create_sheet_indexes():
+    await db.expense_sheets.create_index(
+        [("user_id", 1), ("created_at", -1)], name="user_created_at"
+    )
+    await db.expense_sheets.create_index(
+        [("id", 1), ("user_id", 1)], unique=True, name="id_user"
+    )
+
+async def create_sheet_page_index():
+    # Supersedes user_created_at for keyset pagination on (created_at, id)
+    await db.expense_sheets.create_index(
+        [("user_id", 1), ("created_at", -1), ("id", -1)], name="user_created_at_id"
+    )
+    if "user_created_at" in await db.expense_sheets.index_information():
+        await db.expense_sheets.drop_index("user_created_at")
+
+async def create_expense_query_indexes():
+    # Back the filtered expense listing's alternative sort orders
+    await db.expenses.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("amount", 1), ("id", 1)], name="user_sheet_amount_id"
+    )
+    await db.expenses.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("category", 1), ("date", 1), ("id", 1)], name="user_sheet_category_date_id"
+    )
+
+CONTENT_HASH_BATCH_SIZE = int(os.environ.get('CONTENT_HASH_BATCH_SIZE', '500'))
+
+async def backfill_content_hashes():
+    await db.expenses.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("content_hash", 1)], name="user_sheet_content_hash"
+    )
+    missing = {"content_hash": {"$exists": False}}
+    while True:
+        batch = await db.expenses.find(
+            missing, {"_id": 1, "date": 1, "amount": 1, "description": 1}
+        ).limit(CONTENT_HASH_BATCH_SIZE).to_list(CONTENT_HASH_BATCH_SIZE)
+        if not batch:
+            break
+        await db.expenses.bulk_write([
+            UpdateOne({"_id": expense['_id'], **missing}, {"$set": {"content_hash": expense_hash(expense)}})
+            for expense in batch
+        ], ordered=False)
+    
+    sheets_per_batch = max(1, CONTENT_HASH_BATCH_SIZE // 100)
+    while True:
+        batch = await db.expense_sheets.find(
+            {"expenses": {"$elemMatch": missing}},
+            {"_id": 1, "expenses": 1, "updated_at": 1, "revision": 1}
+        ).limit(sheets_per_batch).to_list(sheets_per_batch)
+        if not batch:
+            break
+        for sheet in batch:
+            for expense in sheet['expenses']:
+                expense.setdefault('content_hash', expense_hash(expense))
+        # The array is rewritten whole, so a sheet written to since it was read is
+        # skipped here and read again on the next pass
+        await db.expense_sheets.bulk_write([
+            UpdateOne(
+                {"_id": sheet['_id'], "updated_at": sheet.get('updated_at'), "revision": sheet.get('revision')},
+                {"$set": {"expenses": sheet['expenses']}}
+            )
+            for sheet in batch
+        ], ordered=False)
+
+async def create_search_indexes():
+    # Entries are filled in by build_search_index, which runs in the background
+    await db.expense_search.create_index(
+        [("user_id", 1), ("sheet_id", 1), ("expense_id", 1)], unique=True, name="user_sheet_expense"
+    )
+    await db.expense_search.create_index([("user_id", 1), ("terms", 1)], name="user_terms")
+
+async def backfill_sheet_revisions():
+    await db.expense_sheets.update_many({"revision": {"$exists": False}}, {"$set": {"revision": 0}})
+
+async def backfill_budget_allocations():
+    cursor = db.expense_sheets.find(
+        {"budgets.0": {"$exists": True}, "stats.budgets": {"$exists": False}, "stats": {"$ne": None}},
+        {"_id": 1, "budgets": 1}
+    )
+    async for sheet in cursor:
+        await db.expense_sheets.update_one(
+            {"_id": sheet['_id']}, {"$set": {"stats.budgets": budget_allocations(sheet['budgets'])}}
+        )
+
+async def create_rollup_indexes():
+    await db.rollups.create_index(
+        [("user_id", 1), ("month", 1), ("category", 1)], unique=True, name="user_month_category"
+    )
+
+async def rebuild_rollups(user_id: Optional[str] = None):
+    # Recomputes rollups from the expenses themselves and writes them with $merge.
+    # Mutations that land while this runs can be lost or counted twice, so run it
+    # when the user (or, for a full rebuild, the deployment) is quiet.
+    query = {"user_id": user_id} if user_id else {}
+    await db.rollups.delete_many(query)
+    # A sheet that still carries an embedded array (before or mid-migration to the
+    # expenses collection) is summed from that array, like recompute_sheet_stats
+    # does, and its rows in the collection, if any, are left out
+    sources = [(db.expense_sheets, [
+        {"$match": {**query, "expenses.0": {"$exists": True}}},
+        {"$unwind": "$expenses"},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "month": "$month", "category": "$expenses.category"},
+            "total": {"$sum": "$expenses.amount"},
+            "count": {"$sum": 1}
+        }}
+    ])]
+    if EXPENSE_STORAGE == 'collection':
+        # Sum per sheet first so each sheet's month is looked up once per category
+        sources.append((db.expenses, [
+            {"$match": query},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "sheet_id": "$sheet_id", "category": "$category"},
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1}
+            }},
+            {"$lookup": {"from": "expense_sheets", "localField": "_id.sheet_id", "foreignField": "id", "as": "sheet"}},
+            {"$unwind": "$sheet"},
+            {"$match": {"sheet.expenses.0": {"$exists": False}}},
+            {"$group": {
+                "_id": {"user_id": "$_id.user_id", "month": "$sheet.month", "category": "$_id.category"},
+                "total": {"$sum": "$total"},
+                "count": {"$sum": "$count"}
+            }}
+        ]))
+    for collection, pipeline in sources:
+        # Each source adds onto what the ones before it wrote for the same month and category
+        pipeline += [
+            {"$project": {
+                "_id": 0, "user_id": "$_id.user_id", "month": "$_id.month", "category": "$_id.category",
+                "total": 1, "count": 1
+            }},
+            {"$merge": {
+                "into": "rollups", "on": ["user_id", "month", "category"],
+                "whenMatched": [{"$set": {
+                    "total": {"$add": ["$total", "$$new.total"]},
+                    "count": {"$add": ["$count", "$$new.count"]}
+                }}],
+                "whenNotMatched": "insert"
+            }}
+        ]
+        await collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+SCHEMA_MIGRATIONS = [
+    (1, "users indexes", create_user_indexes),
+    (2, "expense_sheets indexes", create_sheet_indexes),
+    (3, "expenses indexes", ensure_expense_indexes),
+    (4, "expense_sheets stats backfill", backfill_sheet_stats),
+    (5, "expense_sheets pagination index", create_sheet_page_index),
+    (6, "expenses query indexes", create_expense_query_indexes),
+    (7, "expense content hashes", backfill_content_hashes),
+    (8, "rollups indexes", create_rollup_indexes),
+    (9, "rollups backfill", rebuild_rollups),
+    (10, "expense_sheets revisions", backfill_sheet_revisions),
+    (11, "expense_sheets budget allocations", backfill_budget_allocations),
+    (12, "expense_search indexes", create_search_indexes),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+async def wait_for_pending_migration() -> dict:
+    # Another worker may be applying a migration right now; wait for it as long as
+    # it keeps renewing its lease before treating the pending marker as a
+    # half-applied migration.
+    while True:
+        state = await db.schema_version.find_one({"_id": "schema"})
+        if state.get('pending') is None:
+            return state
+        
+        # Markers written before heartbeats existed only carry pending_since
+        heartbeat_at = state.get('heartbeat_at') or state['pending_since']
+        if isinstance(heartbeat_at, str):
+            heartbeat_at = parse_timestamp(heartbeat_at)
+        if datetime.now(timezone.utc) - heartbeat_at > timedelta(seconds=SCHEMA_MIGRATION_LEASE_SECONDS):
+            raise RuntimeError(
+                f"Schema migration {state['pending']} was started at {state['pending_since']} and never "
+                f"completed; its last heartbeat was at {heartbeat_at}. Inspect the database, then clear "
+                f"`pending` in the schema_version collection."
+            )
+        await asyncio.sleep(1)
+
+async def renew_migration_lease(version: int):
+    while True:
+        await asyncio.sleep(SCHEMA_MIGRATION_HEARTBEAT_SECONDS)
+        await db.schema_version.update_one(
+            {"_id": "schema", "pending": version}, {"$set": {"heartbeat_at": utc_now()}}
+        )
+
+async def bootstrap_schema() -> int:
+    try:
+        await db.schema_version.update_one(
+            {"_id": "schema"},
+            {"$setOnInsert": {"version": 0, "pending": None}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Created concurrently by another worker
+    
+    migrations = {version: (name, migrate) for version, name, migrate in SCHEMA_MIGRATIONS}
+    state = await wait_for_pending_migration()
+    if state['version'] > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {state['version']} is newer than this server ({SCHEMA_VERSION})"
+        )
+    
+    while state['version'] < SCHEMA_VERSION:
+        version = state['version'] + 1
+        name, migrate = migrations[version]
+        claimed = await db.schema_version.find_one_and_update(
+            {"_id": "schema", "version": state['version'], "pending": None},
+            {"$set": {"pending": version, "pending_since": utc_now(), "heartbeat_at": utc_now()}}
+        )
+        if claimed is not None:
+            logger.info(f"Applying schema migration {version}: {name}")
+            heartbeat = asyncio.create_task(renew_migration_lease(version))
+            try:
+                await migrate()
+            finally:
+                heartbeat.cancel()
+            await db.schema_version.update_one(
+                {"_id": "schema"},
+                {
+                    "$set": {"version": version, "pending": None, "applied_at": utc_now()},
+                    "$unset": {"pending_since": "", "heartbeat_at": ""}
+                }
+            )
+        # Otherwise another worker claimed it; wait for it to finish
+        state = await wait_for_pending_migration()
+    
+    return state['version']
+
+# Datetime migration. Converts documents still holding ISO-string timestamps or
+# expense dates, a batch at a time in _id order, and checkpoints the last _id
+# per collection in schema_version so an interrupted run resumes there. It runs
+# in the background after startup; manage.py migrate-datetimes --restart rescans
+# from the beginning. Every write is guarded on the values it replaces, so a
+# concurrent request write or a second run is never overwritten.
+DATETIME_MIGRATION_BATCH_SIZE = int(os.environ.get('DATETIME_MIGRATION_BATCH_SIZE', '200'))
+
+def migrated_expense_date(value):
+    # Free-text dates that never parsed stay strings; reads format either type
+    if isinstance(value, str):
+        try:
+            return parse_expense_date(value)
+        except ValueError:
+            return value
+    return value
+
+def timestamp_update(doc: dict, fields) -> tuple:
+    # Returns (filter, $set values) for the string timestamps among fields
+    values = {field: parse_timestamp(doc[field]) for field in fields if isinstance(doc.get(field), str)}
+    return {"_id": doc['_id'], **{field: doc[field] for field in values}}, values
+
+def user_datetime_update(user: dict) -> tuple:
+    return timestamp_update(user, ('created_at',))
+
+def sheet_datetime_update(sheet: dict) -> tuple:
+    guard, values = timestamp_update(sheet, ('created_at', 'updated_at'))
+    expenses = sheet.get('expenses') or []
+    dates = [migrated_expense_date(expense['date']) for expense in expenses]
+    if any(date is not expense['date'] for date, expense in zip(dates, expenses)):
+        # The array is rewritten whole, so the sheet must not have changed since it was read
+        values['expenses'] = [{**expense, "date": date} for date, expense in zip(dates, expenses)]
+        guard['revision'] = sheet.get('revision', 0)
+    return guard, values
+
+def expense_datetime_update(expense: dict) -> tuple:
+    date = migrated_expense_date(expense['date'])
+    values = {"date": date} if date is not expense['date'] else {}
+    return {"_id": expense['_id'], "date": expense['date']}, values
+
+STRING_TYPE = {"$type": "string"}
+DATETIME_MIGRATIONS = [
+    ("users", {"created_at": STRING_TYPE}, {"_id": 1, "created_at": 1}, user_datetime_update),
+    (
+        "expense_sheets",
+        {"$or": [{"created_at": STRING_TYPE}, {"updated_at": STRING_TYPE}, {"expenses.date": STRING_TYPE}]},
+        {"_id": 1, "created_at": 1, "updated_at": 1, "revision": 1, "expenses": 1},
+        sheet_datetime_update
+    ),
+    ("expenses", {"date": STRING_TYPE}, {"_id": 1, "date": 1}, expense_datetime_update),
+]
+
+async def convert_datetime_batch(collection, query: dict, projection: dict, convert, docs: list) -> int:
+    converted = 0
+    while docs:
+        updates = [update for update in map(convert, docs) if update[1]]
+        if not updates:
+            break
+        result = await collection.bulk_write(
+            [UpdateOne(guard, {"$set": values}) for guard, values in updates], ordered=False
+        )
+        converted += result.modified_count
+        if result.matched_count == len(updates):
+            break
+        # Some documents were written to after they were read; read those again
+        docs = await collection.find(
+            {**query, "_id": {"$in": [guard['_id'] for guard, _ in updates]}}, projection
+        ).to_list(None)
+    return converted
+
+async def migrate_datetimes(restart: bool = False) -> dict:
+    # Returns the number of documents converted per collection
+    checkpoint = {} if restart else await db.schema_version.find_one({"_id": "datetimes"}) or {}
+    converted = {}
+    for name, query, projection, convert in DATETIME_MIGRATIONS:
+        converted[name] = 0
+        last_id = checkpoint.get(name)
+        while True:
+            page = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            batch = await db[name].find(page, projection).sort("_id", 1).limit(
+                DATETIME_MIGRATION_BATCH_SIZE
+            ).to_list(DATETIME_MIGRATION_BATCH_SIZE)
+            if not batch:
+                break
+            converted[name] += await convert_datetime_batch(db[name], query, projection, convert, batch)
+            last_id = batch[-1]['_id']
+            await db.schema_version.update_one({"_id": "datetimes"}, {"$set": {name: last_id}}, upsert=True)
+    return converted
+
+# Search index backfill for expenses written before expense_search existed. Like
+# migrate_datetimes it walks the source in _id order, checkpoints in
+# schema_version and runs in the background after startup; until it finishes,
+# older expenses are simply not found. Entries are only ever inserted, so one a
+# request wrote meanwhile is never replaced with what the backfill read earlier.
+SEARCH_INDEX_BATCH_SIZE = int(os.environ.get('SEARCH_INDEX_BATCH_SIZE', '500'))
+
+async def insert_search_entries(entries: list) -> int:
+    if not entries:
+        return 0
+    updates = [
+        UpdateOne(
+            {"user_id": entry['user_id'], "sheet_id": entry['sheet_id'], "expense_id": entry['expense_id']},
+            {"$setOnInsert": entry},
+            upsert=True
+        )
+        for entry in entries
+    ]
+    try:
+        result = await db.expense_search.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        # A request indexed the same expense between the upsert's lookup and its insert
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        return e.details['nUpserted']
+    return result.upserted_count
+
+async def build_search_index(restart: bool = False) -> int:
+    # Returns the number of expenses indexed
+    checkpoint = {} if restart else await db.schema_version.find_one({"_id": "search_index"}) or {}
+    name = "expenses" if EXPENSE_STORAGE == 'collection' else "expense_sheets"
+    last_id = checkpoint.get(name)
+    indexed = 0
+    while True:
+        page = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        if EXPENSE_STORAGE == 'collection':
+            batch = await db.expenses.find(
+                page, {"_id": 1, "user_id": 1, "sheet_id": 1, "id": 1, "date": 1, "description": 1, "category": 1}
+            ).sort("_id", 1).limit(SEARCH_INDEX_BATCH_SIZE).to_list(SEARCH_INDEX_BATCH_SIZE)
+            entries = [search_entry(expense['user_id'], expense['sheet_id'], expense) for expense in batch]
+        else:
+            # A sheet brings its whole array, so far fewer sheets than expenses per batch
+            sheets_per_batch = max(1, SEARCH_INDEX_BATCH_SIZE // 100)
+            batch = await db.expense_sheets.find(
+                {**page, "expenses.0": {"$exists": True}},
+                {"_id": 1, "id": 1, "user_id": 1, "expenses.id": 1, "expenses.date": 1,
+                 "expenses.description": 1, "expenses.category": 1}
+            ).sort("_id", 1).limit(sheets_per_batch).to_list(sheets_per_batch)
+            entries = [
+                search_entry(sheet['user_id'], sheet['id'], expense)
+                for sheet in batch for expense in sheet['expenses']
+            ]
+        if not batch:
+            break
+        
+        for start in range(0, len(entries), SEARCH_INDEX_BATCH_SIZE):
+            indexed += await insert_search_entries(entries[start:start + SEARCH_INDEX_BATCH_SIZE])
+        last_id = batch[-1]['_id']
+        await db.schema_version.update_one({"_id": "search_index"}, {"$set": {name: last_id}}, upsert=True)
+    return indexed
+
+# Keyset pagination. Cursors are the sort key of the last row served, with
+# datetimes tagged so they decode back to datetimes.
+def encode_cursor(*values) -> str:
+    values = [{"$date": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [parse_timestamp(value['$date']) if isinstance(value, dict) else value for value in values]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(field: str, direction: int, value, last_id: str, prefix: str = "") -> dict:
+    op = "$gt" if direction == 1 else "$lt"
+    branches = [
+        {f"{prefix}{field}": {op: value}},
+        {f"{prefix}{field}": value, f"{prefix}id": {op: last_id}}
+    ]
+    # Until the datetime migration finishes a date field can hold strings and
+    # datetimes. BSON orders every string before every date, so a page boundary
+    # on one type still has the rows of the other type ahead of it.
+    if isinstance(value, datetime) and direction == -1:
+        branches.append({f"{prefix}{field}": {"$type": "string"}})
+    elif isinstance(value, str) and direction == 1 and field in ('date', 'created_at'):
+        branches.append({f"{prefix}{field}": {"$type": "date"}})
+    return {"$or": branches}
+
+async def find_sheet_page(user_id: str, projection: dict, limit: int, cursor: Optional[str]):
+    # Returns (sheets, next_cursor) ordered by (created_at, id), newest first;
+    # next_cursor is None on the last page
+    query = {"user_id": user_id}
+    if cursor:
+        query.update(keyset_filter("created_at", -1, *decode_cursor(cursor)))
+    
+    sheets = await db.expense_sheets.find(query, projection).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(sheets) > limit:
+        sheets = sheets[:limit]
+        next_cursor = encode_cursor(sheets[-1]['created_at'], sheets[-1]['id'])
+    return sheets, next_cursor
+
+def expense_filter(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    categories: Optional[List[str]] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    prefix: str = ""
+) -> dict:
+    query = {}
+    if date_from or date_to:
+        bounds = {
+            **({"$gte": date_from} if date_from else {}),
+            **({"$lte": date_to} if date_to else {})
+        }
+        try:
+            date_bounds = {op: parse_expense_date(value) for op, value in bounds.items()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_from and date_to must be YYYY-MM-DD")
+        # The string range matches expenses the datetime migration has not reached yet
+        query["$or"] = [{f"{prefix}date": date_bounds}, {f"{prefix}date": bounds}]
+    if categories:
+        query[f"{prefix}category"] = {"$in": categories}
+    if min_amount is not None or max_amount is not None:
+        query[f"{prefix}amount"] = {
+            **({"$gte": min_amount} if min_amount is not None else {}),
+            **({"$lte": max_amount} if max_amount is not None else {})
+        }
+    return query
+
+def expense_page_match(base: dict, filters: dict, field: str, direction: int, cursor: Optional[str],
+                       prefix: str = "") -> dict:
+    query = {**base, **expense_filter(**filters, prefix=prefix)}
+    if cursor:
+        query = {"$and": [query, keyset_filter(field, direction, *decode_cursor(cursor), prefix=prefix)]}
+    return query
+
+def cut_expense_page(expenses: list, field: str, limit: int):
+    # Pages are read with limit + 1 rows; the extra row only signals that more follow
+    if len(expenses) <= limit:
+        return expenses, None
+    expenses = expenses[:limit]
+    return expenses, encode_cursor(expenses[-1][field], expenses[-1]['id'])
+
+async def find_expense_page(sheet: dict, filters: dict, sort: str, limit: int, cursor: Optional[str]):
+    # Returns (expenses, next_cursor) ordered by the sort field with id as tie-breaker
+    field, direction = sort.lstrip('-'), -1 if sort.startswith('-') else 1
+    
+    if EXPENSE_STORAGE == 'collection':
+        query = expense_page_match(
+            {"user_id": sheet['user_id'], "sheet_id": sheet['id']}, filters, field, direction, cursor
+        )
+        expenses = await db.expenses.find(query, EXPENSE_PROJECTION | {"sheet_id": 0}).sort(
+            [(field, direction), ("id", direction)]
+        ).limit(limit + 1).to_list(limit + 1)
+    else:
+        # Array elements can't be index-scanned, so filter, sort and cut the page inside MongoDB
+        pipeline = [
+            {"$match": {"id": sheet['id'], "user_id": sheet['user_id']}},
+            {"$unwind": "$expenses"},
+            {"$match": expense_page_match({}, filters, field, direction, cursor, prefix="expenses.")},
+            {"$sort": {f"expenses.{field}": direction, "expenses.id": direction}},
+            {"$limit": limit + 1},
+            {"$replaceRoot": {"newRoot": "$expenses"}}
+        ]
+        expenses = await db.expense_sheets.aggregate(pipeline, allowDiskUse=True).to_list(limit + 1)
+    
+    return cut_expense_page(expenses, field, limit)
+
+# Sheet view: the header, a page of expenses and the stats in one read. fields=
+# names whole sections or section.field; only what is named is projected.
+SHEET_VIEW_FIELDS = {
+    "header": ["name", "month", "monthly_salary", "budgets", "revision", "created_at", "updated_at"],
+    "expenses": ["date", "category", "description", "amount"],
+    "stats": ["total", "by_category", "count", "remaining_budget", "total_budget", "overspent_categories"]
+}
+
+def parse_view_fields(fields: Optional[str]) -> dict:
+    # Returns {section: [field, ...]} in SHEET_VIEW_FIELDS order
+    if not fields:
+        return {section: list(names) for section, names in SHEET_VIEW_FIELDS.items()}
+    
+    wanted = {}
+    for token in fields.split(','):
+        section, dot, name = token.strip().partition('.')
+        names = SHEET_VIEW_FIELDS.get(section)
+        if names is None or (dot and name not in names):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {token.strip()}")
+        wanted.setdefault(section, set()).update([name] if name else names)
+    return {section: [name for name in names if name in wanted[section]]
+            for section, names in SHEET_VIEW_FIELDS.items() if section in wanted}
+
+def sheet_view_projection(selected: dict) -> dict:
+    projection = {"_id": 0, "id": 1, "user_id": 1}
+    projection.update({name: 1 for name in selected.get('header', [])})
+    stats = selected.get('stats', [])
+    if stats:
+        projection['stats'] = 1
+    if 'remaining_budget' in stats:
+        projection['monthly_salary'] = 1
+    if 'total_budget' in stats or 'overspent_categories' in stats:
+        # Allocations for sheets whose stats predate stats.budgets
+        projection['budgets'] = 1
+    return projection
+
+async def find_sheet_view(sheet_id: str, user_id: str, selected: dict, filters: dict, sort: str,
+                          limit: int, cursor: Optional[str]):
+    # Returns (sheet, expenses, next_cursor), or None when the sheet is not found.
+    # With expenses selected the page is cut in the same aggregation as the sheet read.
+    projection = sheet_view_projection(selected)
+    if 'expenses' not in selected:
+        sheet = await db.expense_sheets.find_one({"id": sheet_id, "user_id": user_id}, projection)
+        return sheet and (sheet, None, None)
+    
+    field, direction = sort.lstrip('-'), -1 if sort.startswith('-') else 1
+    # id and the sort field are always read: the next page's cursor is built from them.
+    # So is every filtered field, because the embedded layout filters after projecting.
+    expense_fields = {"id", field, *selected['expenses']}
+    if filters.get('date_from') or filters.get('date_to'):
+        expense_fields.add('date')
+    if filters.get('categories'):
+        expense_fields.add('category')
+    if filters.get('min_amount') is not None or filters.get('max_amount') is not None:
+        expense_fields.add('amount')
+    order = {"$sort": {field: direction, "id": direction}}
+    
+    if EXPENSE_STORAGE == 'collection':
+        pipeline = [
+            {"$match": {"id": sheet_id, "user_id": user_id}},
+            {"$project": projection},
+            {"$lookup": {"from": "expenses", "as": "expenses", "pipeline": [
+                {"$match": expense_page_match(
+                    {"user_id": user_id, "sheet_id": sheet_id}, filters, field, direction, cursor
+                )},
+                order,
+                {"$limit": limit + 1},
+                {"$project": {"_id": 0, **{name: 1 for name in expense_fields}}}
+            ]}}
+        ]
+        result = await db.expense_sheets.aggregate(pipeline).to_list(1)
+        if not result:
+            return None
+        sheet = result[0]
+        expenses = sheet.pop('expenses')
+    else:
+        pipeline = [
+            {"$match": {"id": sheet_id, "user_id": user_id}},
+            {"$project": {**projection, **{f"expenses.{name}": 1 for name in expense_fields}}},
+            {"$facet": {
+                "sheet": [{"$project": {"expenses": 0}}],
+                "expenses": [
+                    {"$unwind": "$expenses"},
+                    {"$replaceRoot": {"newRoot": "$expenses"}},
+                    {"$match": expense_page_match({}, filters, field, direction, cursor)},
+                    order,
+                    {"$limit": limit + 1}
+                ]
+            }}
+        ]
+        result = await db.expense_sheets.aggregate(pipeline, allowDiskUse=True).to_list(1)
+        if not result or not result[0]['sheet']:
+            return None
+        sheet, expenses = result[0]['sheet'][0], result[0]['expenses']
+    
+    expenses, next_cursor = cut_expense_page(expenses, field, limit)
+    return sheet, expenses, next_cursor
+
+def sheet_expense_pipeline(sheet: dict, filters: Optional[dict] = None):
+    # Returns (collection name, pipeline) yielding one sheet's expenses in (date, id) order.
+    # Shared by the async request path and the synchronous PDF worker.
+    filters = filters or {}
+    if EXPENSE_STORAGE == 'collection':
+        return "expenses", [
+            {"$match": {"user_id": sheet['user_id'], "sheet_id": sheet['id'], **expense_filter(**filters)}},
+            {"$sort": {"date": 1, "id": 1}},
+            {"$project": EXPENSE_PROJECTION | {"sheet_id": 0}}
+        ]
+    return "expense_sheets", [
+        {"$match": {"id": sheet['id'], "user_id": sheet['user_id']}},
+        {"$unwind": "$expenses"},
+        {"$match": expense_filter(**filters, prefix="expenses.")},
+        {"$sort": {"expenses.date": 1, "expenses.id": 1}},
+        {"$replaceRoot": {"newRoot": "$expenses"}}
+    ]
+
+async def iter_sheet_expenses(sheet: dict, filters: Optional[dict] = None, batch_size: int = 500):
+    # Streams one sheet's expenses straight off a MongoDB cursor
+    collection, pipeline = sheet_expense_pipeline(sheet, filters)
+    cursor = db[collection].aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    try:
+        async for expense in cursor:
+            yield expense
+    finally:
+        await cursor.close()
+
+async def find_search_page(user_id: str, words: list, date_from: Optional[str], date_to: Optional[str],
+                           limit: int, cursor: Optional[str]):
+    # Returns (hits, next_cursor) ordered by (score, date, id), best and newest first.
+    # Every query word must match a word of the expense as a prefix.
+    # $all walks the index on its first value, so lead with the most selective word
+    terms = sorted(words, key=len, reverse=True)
+    exact = [f"={word}" for word in words]
+    pipeline = [
+        {"$match": {"user_id": user_id, "terms": {"$all": terms}, **expense_filter(date_from=date_from, date_to=date_to)}},
+        {"$project": {
+            "_id": 0, "sheet_id": 1, "id": "$expense_id", "date": 1,
+            "score": {"$size": {"$setIntersection": ["$terms", exact]}}
+        }}
+    ]
+    if cursor:
+        score, date, last_id = decode_cursor(cursor)
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, **keyset_filter("date", -1, date, last_id)}
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "date": -1, "id": -1}},
+        {"$limit": limit + 1}
+    ]
+    entries = await db.expense_search.aggregate(pipeline, allowDiskUse=True).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(entries[-1]['score'], entries[-1]['date'], entries[-1]['id'])
+    if not entries:
+        return [], next_cursor
+    
+    # Fetch the page's expenses and sheet names from where they live
+    sheet_ids = list({entry['sheet_id'] for entry in entries})
+    expense_ids = [entry['id'] for entry in entries]
+    sheets = await db.expense_sheets.find(
+        {"user_id": user_id, "id": {"$in": sheet_ids}}, {"_id": 0, "id": 1, "name": 1, "month": 1}
+    ).to_list(None)
+    if EXPENSE_STORAGE == 'collection':
+        cursor = db.expenses.find(
+            {"user_id": user_id, "sheet_id": {"$in": sheet_ids}, "id": {"$in": expense_ids}}, EXPENSE_PROJECTION
+        )
+    else:
+        cursor = db.expense_sheets.aggregate([
+            {"$match": {"user_id": user_id, "id": {"$in": sheet_ids}}},
+            {"$project": {"_id": 0, "expenses": {"$filter": {
+                "input": "$expenses", "cond": {"$in": ["$$this.id", expense_ids]}
+            }}}},
+            {"$unwind": "$expenses"},
+            {"$replaceRoot": {"newRoot": "$expenses"}}
+        ])
+    expenses = {expense['id']: expense async for expense in cursor}
+    sheets = {sheet['id']: sheet for sheet in sheets}
+    
+    # An entry whose expense was deleted after it was read is dropped from the page
+    hits = [
+        {
+            **expenses[entry['id']],
+            "sheet_id": entry['sheet_id'],
+            "sheet_name": sheets[entry['sheet_id']]['name'],
+            "month": sheets[entry['sheet_id']]['month'],
+            "score": entry['score']
+        }
+        for entry in entries
+        if entry['id'] in expenses and entry['sheet_id'] in sheets
+    ]
+    return hits, next_cursor
+
+# Expense import
+def iter_csv_rows(stream):
+    # Yields (row_number, fields) one line at a time from a binary file object
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, {key: (value or '').strip() for key, value in row.items() if key}
+
+OFX_TRANSACTION = re.compile(r'<STMTTRN>(.*?)</STMTTRN>', re.S | re.I)
+OFX_FIELD = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+def iter_ofx_rows(stream, chunk_size: int = 64 * 1024):
+    # Scans the file in chunks and keeps only the unfinished tail between reads.
+    # Debits become expenses; credits are reported back as row errors.
+    buffer = ''
+    row_number = 0
+    decoder = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+    while True:
+        chunk = decoder.read(chunk_size)
+        buffer += chunk
+        last_end = 0
+        for match in OFX_TRANSACTION.finditer(buffer):
+            last_end = match.end()
+            row_number += 1
+            fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(match.group(1))}
+            posted = fields.get('DTPOSTED', '')
+            amount = fields.get('TRNAMT', '')
+            if amount and not amount.startswith('-'):
+                yield row_number, {"error": "Credit transaction, not an expense"}
+                continue
+            yield row_number, {
+                "date": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) >= 8 else posted,
+                "category": "Uncategorized",
+                "description": fields.get('NAME') or fields.get('MEMO', ''),
+                "amount": amount[1:]
+            }
+        if not chunk:
+            return
+        
+        remainder = buffer[last_end:]
+        start = remainder.upper().find('<STMTTRN>')
+        buffer = remainder[start:] if start != -1 else remainder[-len('<STMTTRN>'):]
+
+async def import_expenses(sheet: dict, rows) -> ImportResult:
+    # rows yields (row_number, fields); a parser reports an unusable row as {"error": ...}
+    result = ImportResult(imported=0, duplicates=0, failed=0, errors=[])
+    seen = set()
+    
+    def fail(row_number: int, error: str):
+        result.failed += 1
+        if len(result.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            result.errors.append(ImportRowError(row=row_number, error=error))
+    
+    async def flush(batch: list):
+        if not batch:
+            return
+        duplicates = await existing_hashes(sheet, [expense['content_hash'] for expense in batch])
+        fresh = [expense for expense in batch if expense['content_hash'] not in duplicates]
+        result.duplicates += len(batch) - len(fresh)
+        if fresh:
+            await insert_expenses(sheet, fresh)
+            result.imported += len(fresh)
+    
+    batch = []
+    for row_number, fields in rows:
+        if fields.get('error'):
+            fail(row_number, fields['error'])
+            continue
+        try:
+            item = ExpenseItemCreate(**fields)
+        except ValidationError as e:
+            fail(row_number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        
+        expense = ExpenseItem(**item.model_dump()).model_dump()
+        expense['content_hash'] = expense_hash(expense)
+        if expense['content_hash'] in seen:
+            result.duplicates += 1
+            continue
+        seen.add(expense['content_hash'])
+        
+        batch.append(expense)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    await flush(batch)
+    
+    return result
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
@@ -134,11 +2116,17 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
         
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+        
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         if user_doc is None:
             raise HTTPException(status_code=401, detail="User not found")
         
-        return User(**user_doc)
+        user = User(**user_doc)
+        user_cache.put(user)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.JWTError:
@@ -159,10 +2147,12 @@ async def register(user_data: UserCreate):
     )
     
     user_dict = user.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    user_dict['password'] = hash_password(user_data.password)
+    user_dict['password'] = await run_password_task(hash_password, user_data.password)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create token
     access_token = create_access_token(data={"sub": user.id})
@@ -175,47 +2165,157 @@ async def login(credentials: UserLogin):
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, user_doc['password']):
+    valid, new_hash = await run_password_task(
+        verify_and_update_password, credentials.password, user_doc['password']
+    )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    if new_hash:
+        await db.users.update_one({"id": user_doc['id']}, {"$set": {"password": new_hash}})
+        user_cache.invalidate(user_doc['id'])
+    
     user = User(**{k: v for k, v in user_doc.items() if k != 'password'})
     access_token = create_access_token(data={"sub": user.id})
     
     return Token(access_token=access_token, token_type="bearer", user=user)
 
+# Fast path for sheet responses. Documents read back from MongoDB were validated
+# on the way in, so handlers shape them to the ExpenseSheet fields and encode them
+# once with orjson, instead of building ExpenseSheet and having FastAPI validate
+# and serialize it a second time. response_model stays on the routes for OpenAPI.
+def expense_document(expense: dict) -> dict:
+    return {
+        "id": expense['id'],
+        "date": format_expense_date(expense['date']),
+        "category": expense['category'],
+        "description": expense['description'],
+        "amount": expense['amount']
+    }
+
+def sheet_document(sheet: dict) -> dict:
+    return {
+        "id": sheet['id'],
+        "user_id": sheet['user_id'],
+        "name": sheet['name'],
+        "month": sheet['month'],
+        "monthly_salary": sheet.get('monthly_salary', 0.0),
+        "budgets": [{"category": b['category'], "allocated": b['allocated']} for b in sheet.get('budgets', [])],
+        "expenses": [expense_document(e) for e in sheet.get('expenses', [])],
+        "revision": sheet.get('revision', 0),
+        "created_at": sheet['created_at'],
+        "updated_at": sheet['updated_at']
+    }
+
+def sheet_response(sheet: dict, headers: Optional[dict] = None) -> ORJSONResponse:
+    return ORJSONResponse(sheet_document(sheet), headers=headers)
+
+# Conditional reads. Every write to a sheet or its expenses bumps revision and
+# updated_at, so (id, revision, updated_at) identifies a version and a header-only
+# read is enough to answer If-None-Match without touching the expenses. updated_at
+# alone is not enough: two writes can land in the same millisecond.
+SHEET_VERSION_PROJECTION = {"_id": 0, "id": 1, "revision": 1, "created_at": 1, "updated_at": 1}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in candidates or etag.removeprefix('W/') in candidates
+
+def sheets_etag(kind: str, sheets: list) -> str:
+    # Weak: equal tags mean the same sheet versions, not byte-identical bodies
+    versions = "|".join(f"{sheet['id']}@{sheet.get('revision', 0)}@{sheet['updated_at']}" for sheet in sheets)
+    return 'W/"' + hashlib.sha1(f"{kind}|{versions}".encode()).hexdigest()[:20] + '"'
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+async def find_sheet_versions(user_id: str, sheet_ids: list) -> Optional[list]:
+    # Header-only read of the given sheets, in order; None if any is missing
+    sheets = await db.expense_sheets.find(
+        {"id": {"$in": sheet_ids}, "user_id": user_id}, SHEET_VERSION_PROJECTION
+    ).to_list(len(sheet_ids))
+    by_id = {sheet['id']: sheet for sheet in sheets}
+    if any(sheet_id not in by_id for sheet_id in sheet_ids):
+        return None
+    return [by_id[sheet_id] for sheet_id in sheet_ids]
+
 # Expense Sheet endpoints
 @api_router.post("/sheets", response_model=ExpenseSheet)
 async def create_sheet(sheet_data: ExpenseSheetCreate, current_user: User = Depends(get_current_user)):
     sheet = ExpenseSheet(
         user_id=current_user.id,
         name=sheet_data.name,
-        month=sheet_data.month
+        month=sheet_data.month,
+        monthly_salary=sheet_data.monthly_salary,
+        budgets=sheet_data.budgets
     )
     
     sheet_dict = sheet.model_dump()
-    sheet_dict['created_at'] = sheet_dict['created_at'].isoformat()
-    sheet_dict['updated_at'] = sheet_dict['updated_at'].isoformat()
+    sheet_dict['stats'] = {**empty_stats(), "budgets": budget_allocations(sheet_dict['budgets'])}
     
     await db.expense_sheets.insert_one(sheet_dict)
+    await bump_data_version(current_user.id)
     return sheet
 
 @api_router.get("/sheets", response_model=List[ExpenseSheet])
-async def get_sheets(current_user: User = Depends(get_current_user)):
-    sheets = await db.expense_sheets.find(
-        {"user_id": current_user.id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+async def get_sheets(
+    request: Request,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        versions, next_cursor = await find_sheet_page(current_user.id, SHEET_VERSION_PROJECTION, limit, cursor)
+        etag = sheets_etag("sheets", versions)
+        if etag_matches(if_none_match, etag):
+            headers = etag_headers(etag)
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+            return Response(status_code=304, headers=headers)
+    
+    sheets, next_cursor = await find_sheet_page(current_user.id, {"_id": 0}, limit, cursor)
+    headers = etag_headers(sheets_etag("sheets", sheets))
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    await attach_expenses(sheets)
+    
+    return ORJSONResponse([sheet_document(sheet) for sheet in sheets], headers=headers)
+
+@api_router.get("/sheets/summary", response_model=SheetSummaryPage)
+async def get_sheet_summaries(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    # Header fields plus the maintained total and count; expenses are never read
+    projection = {
+        "_id": 0, "id": 1, "name": 1, "month": 1, "monthly_salary": 1,
+        "created_at": 1, "updated_at": 1, "stats.total": 1, "stats.count": 1
+    }
+    sheets, next_cursor = await find_sheet_page(current_user.id, projection, limit, cursor)
     
+    items = []
     for sheet in sheets:
-        if isinstance(sheet['created_at'], str):
-            sheet['created_at'] = datetime.fromisoformat(sheet['created_at'])
-        if isinstance(sheet['updated_at'], str):
-            sheet['updated_at'] = datetime.fromisoformat(sheet['updated_at'])
+        stats = sheet.pop('stats', None) or {}
+        items.append(SheetSummary(**sheet, total=stats.get('total', 0.0), count=stats.get('count', 0)))
     
-    return sheets
+    return SheetSummaryPage(items=items, next_cursor=next_cursor)
 
 @api_router.get("/sheets/{sheet_id}", response_model=ExpenseSheet)
-async def get_sheet(sheet_id: str, current_user: User = Depends(get_current_user)):
+async def get_sheet(
+    sheet_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        versions = await find_sheet_versions(current_user.id, [sheet_id])
+        etag = versions and sheets_etag("sheet", versions)
+        if etag and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=etag_headers(etag))
+    
     sheet = await db.expense_sheets.find_one(
         {"id": sheet_id, "user_id": current_user.id},
         {"_id": 0}
@@ -223,169 +2323,489 @@ async def get_sheet(sheet_id: str, current_user: User = Depends(get_current_user
     
     if not sheet:
         raise HTTPException(status_code=404, detail="Sheet not found")
+    await attach_expenses([sheet])
     
-    if isinstance(sheet['created_at'], str):
-        sheet['created_at'] = datetime.fromisoformat(sheet['created_at'])
-    if isinstance(sheet['updated_at'], str):
-        sheet['updated_at'] = datetime.fromisoformat(sheet['updated_at'])
-    
-    return ExpenseSheet(**sheet)
+    return sheet_response(sheet, etag_headers(sheets_etag("sheet", [sheet])))
 
 @api_router.delete("/sheets/{sheet_id}")
 async def delete_sheet(sheet_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.expense_sheets.delete_one({"id": sheet_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+    sheet = await db.expense_sheets.find_one_and_delete(
+        {"id": sheet_id, "user_id": current_user.id},
+        projection={"_id": 0, "id": 1, "user_id": 1, "month": 1, "stats": 1}
+    )
+    if sheet is None:
         raise HTTPException(status_code=404, detail="Sheet not found")
+    if EXPENSE_STORAGE == 'collection':
+        await db.expenses.delete_many({"user_id": current_user.id, "sheet_id": sheet_id})
+    await unindex_expenses(current_user.id, sheet_id)
+    if sheet.get('stats'):
+        await apply_rollups(sheet, {
+            category_name(key): (-entry['total'], -entry['count'])
+            for key, entry in sheet['stats']['by_category'].items()
+        })
+    await bump_data_version(current_user.id)
+    await sheet_events.publish(sheet_id, "sheet.deleted", {})
     return {"message": "Sheet deleted successfully"}
 
-# Expense endpoints
-@api_router.post("/sheets/{sheet_id}/expenses", response_model=ExpenseSheet)
-async def add_expense(sheet_id: str, expense_data: ExpenseItemCreate, current_user: User = Depends(get_current_user)):
-    sheet = await db.expense_sheets.find_one(
-        {"id": sheet_id, "user_id": current_user.id},
-        {"_id": 0}
+@api_router.put("/sheets/{sheet_id}/budgets", response_model=ExpenseSheet)
+async def update_budgets(
+    sheet_id: str,
+    budget_data: BudgetUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    budgets = [budget.model_dump() for budget in budget_data.budgets]
+    values = {"budgets": budgets, "stats.budgets": budget_allocations(budgets), "updated_at": utc_now()}
+    if budget_data.monthly_salary is not None:
+        values["monthly_salary"] = budget_data.monthly_salary
+    
+    query = {"id": sheet_id, "user_id": current_user.id}
+    revision = await if_match_revision(sheet_id, current_user.id, if_match)
+    if revision is not None:
+        query["revision"] = revision
+    sheet = await db.expense_sheets.find_one_and_update(
+        query, {"$set": values, "$inc": {"revision": 1}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
     )
     
-    if not sheet:
+    if sheet is None:
+        if revision is not None:
+            raise await revision_conflict(sheet_id, current_user.id)
         raise HTTPException(status_code=404, detail="Sheet not found")
+    await sheet_events.publish(sheet_id, "sheet.changed", {"revision": sheet['revision'], "updated_at": sheet['updated_at']})
+    await attach_expenses([sheet])
     
-    expense = ExpenseItem(**expense_data.model_dump())
-    
-    await db.expense_sheets.update_one(
-        {"id": sheet_id},
-        {
-            "$push": {"expenses": expense.model_dump()},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-        }
+    return sheet_response(sheet)
+
+# Expense endpoints. view=sheet (the default) returns the whole sheet after the
+# write; view=delta returns only the affected expense and the updated totals.
+def mutation_projection(view: str) -> dict:
+    if view == 'delta':
+        return {"_id": 0, "id": 1, "user_id": 1, "month": 1, "stats": 1, "revision": 1, "updated_at": 1}
+    return {"_id": 0}
+
+def expense_change(sheet: dict, expense: dict, deleted: bool = False) -> dict:
+    total, by_category, count = read_stats(sheet)
+    stats = sheet.get('stats') or empty_stats()
+    return {
+        "expense": expense_document(expense),
+        "deleted": deleted,
+        "total": total,
+        "count": count,
+        "by_category": by_category,
+        "overspent_categories": overspent_categories(stats, stats.get('budgets') or {}),
+        "revision": sheet.get('revision', 0),
+        "updated_at": sheet['updated_at']
+    }
+
+async def mutation_response(sheet: dict, expense: dict, view: str, event_type: str,
+                            deleted: bool = False) -> ORJSONResponse:
+    # The delta view and the change feed event carry the same payload
+    change = expense_change(sheet, expense, deleted)
+    await sheet_events.publish(sheet['id'], event_type, change)
+    if view == 'delta':
+        return ORJSONResponse(change)
+    await attach_expenses([sheet])
+    return sheet_response(sheet)
+
+async def publish_import(sheet: dict, result: ImportResult):
+    # An import is too large to send as deltas; subscribers reload the sheet
+    if not result.imported:
+        return
+    version = await db.expense_sheets.find_one({"id": sheet['id']}, {"_id": 0, "revision": 1, "updated_at": 1})
+    if version is not None:
+        await sheet_events.publish(sheet['id'], "sheet.changed", version)
+
+async def sheet_exists(sheet_id: str, user_id: str) -> bool:
+    return await db.expense_sheets.find_one({"id": sheet_id, "user_id": user_id}, {"_id": 1}) is not None
+
+@api_router.post("/sheets/{sheet_id}/expenses", response_model=Union[ExpenseSheet, ExpenseChange])
+async def add_expense(
+    sheet_id: str,
+    expense_data: ExpenseItemCreate,
+    view: str = Query("sheet", pattern="^(sheet|delta)$"),
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    expense = ExpenseItem(**expense_data.model_dump()).model_dump()
+    sheet = await insert_expense(
+        sheet_id, current_user.id, expense, mutation_projection(view),
+        await if_match_revision(sheet_id, current_user.id, if_match)
     )
     
-    updated_sheet = await db.expense_sheets.find_one({"id": sheet_id}, {"_id": 0})
-    if isinstance(updated_sheet['created_at'], str):
-        updated_sheet['created_at'] = datetime.fromisoformat(updated_sheet['created_at'])
-    if isinstance(updated_sheet['updated_at'], str):
-        updated_sheet['updated_at'] = datetime.fromisoformat(updated_sheet['updated_at'])
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet not found")
     
-    return ExpenseSheet(**updated_sheet)
+    return await mutation_response(sheet, expense, view, "expense.added")
 
-@api_router.put("/sheets/{sheet_id}/expenses/{expense_id}", response_model=ExpenseSheet)
+@api_router.put("/sheets/{sheet_id}/expenses/{expense_id}", response_model=Union[ExpenseSheet, ExpenseChange])
 async def update_expense(
     sheet_id: str,
     expense_id: str,
     expense_data: ExpenseItemCreate,
+    view: str = Query("sheet", pattern="^(sheet|delta)$"),
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    result = await replace_expense(
+        sheet_id, current_user.id, expense_id, expense_data.model_dump(), mutation_projection(view),
+        await if_match_revision(sheet_id, current_user.id, if_match)
+    )
+    
+    if result is None:
+        if not await sheet_exists(sheet_id, current_user.id):
+            raise HTTPException(status_code=404, detail="Sheet not found")
+        raise HTTPException(status_code=404, detail="Expense not found")
+    
+    sheet, expense = result
+    return await mutation_response(sheet, expense, view, "expense.updated")
+
+@api_router.delete("/sheets/{sheet_id}/expenses/{expense_id}", response_model=Union[ExpenseSheet, ExpenseChange])
+async def delete_expense(
+    sheet_id: str,
+    expense_id: str,
+    view: str = Query("sheet", pattern="^(sheet|delta)$"),
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user)
 ):
+    result = await remove_expense(
+        sheet_id, current_user.id, expense_id, mutation_projection(view),
+        await if_match_revision(sheet_id, current_user.id, if_match)
+    )
+    
+    if result is None:
+        # Deleting an expense that is already gone still returns the sheet in the full view
+        sheet = None
+        if view == 'sheet':
+            sheet = await db.expense_sheets.find_one({"id": sheet_id, "user_id": current_user.id}, {"_id": 0})
+        elif await sheet_exists(sheet_id, current_user.id):
+            raise HTTPException(status_code=404, detail="Expense not found")
+        if not sheet:
+            raise HTTPException(status_code=404, detail="Sheet not found")
+        await attach_expenses([sheet])
+        return sheet_response(sheet)
+    
+    sheet, removed = result
+    return await mutation_response(sheet, removed, view, "expense.deleted", deleted=True)
+
+@api_router.post("/sheets/{sheet_id}/expenses/bulk", response_model=ImportResult)
+async def add_expenses_bulk(
+    sheet_id: str,
+    expenses_data: List[ExpenseItemCreate],
+    current_user: User = Depends(get_current_user)
+):
+    if len(expenses_data) > 5000:
+        raise HTTPException(status_code=413, detail="At most 5000 expenses per request")
+    
     sheet = await db.expense_sheets.find_one(
         {"id": sheet_id, "user_id": current_user.id},
-        {"_id": 0}
+        {"_id": 0, "id": 1, "user_id": 1, "month": 1}
     )
     
     if not sheet:
         raise HTTPException(status_code=404, detail="Sheet not found")
     
-    expenses = sheet.get('expenses', [])
-    expense_index = next((i for i, e in enumerate(expenses) if e['id'] == expense_id), None)
-    
-    if expense_index is None:
-        raise HTTPException(status_code=404, detail="Expense not found")
+    rows = ((i, expense.model_dump()) for i, expense in enumerate(expenses_data, start=1))
+    result = await import_expenses(sheet, rows)
+    await publish_import(sheet, result)
+    return result
+
+@api_router.post("/sheets/{sheet_id}/import", response_model=ImportResult)
+async def import_expense_file(
+    sheet_id: str,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ofx)$"),
+    current_user: User = Depends(get_current_user)
+):
+    sheet = await db.expense_sheets.find_one(
+        {"id": sheet_id, "user_id": current_user.id},
+        {"_id": 0, "id": 1, "user_id": 1, "month": 1}
+    )
     
-    expenses[expense_index].update(expense_data.model_dump())
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet not found")
     
-    await db.expense_sheets.update_one(
-        {"id": sheet_id},
-        {
-            "$set": {
-                "expenses": expenses,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-        }
+    # The multipart parser has already spooled the upload to disk; rows are read from it lazily
+    if format is None:
+        format = 'ofx' if (file.filename or '').lower().endswith(('.ofx', '.qfx')) else 'csv'
+    rows = iter_ofx_rows(file.file) if format == 'ofx' else iter_csv_rows(file.file)
+    result = await import_expenses(sheet, rows)
+    await publish_import(sheet, result)
+    return result
+
+def sse_message(event: dict) -> bytes:
+    # The revision doubles as the SSE event id so a client can spot gaps
+    lines = f"event: {event['type']}\n"
+    if event['data'].get('revision') is not None:
+        lines = f"id: {event['data']['revision']}\n" + lines
+    return lines.encode() + b"data: " + orjson.dumps(event['data']) + b"\n\n"
+
+@api_router.get("/sheets/{sheet_id}/events")
+async def stream_sheet_events(sheet_id: str, current_user: User = Depends(get_current_user)):
+    # Subscribe before reading the revision so no write can fall between the two
+    queue = sheet_events.subscribe(sheet_id)
+    sheet = await db.expense_sheets.find_one(
+        {"id": sheet_id, "user_id": current_user.id}, {"_id": 0, "revision": 1, "updated_at": 1}
     )
+    if not sheet:
+        sheet_events.unsubscribe(sheet_id, queue)
+        raise HTTPException(status_code=404, detail="Sheet not found")
     
-    updated_sheet = await db.expense_sheets.find_one({"id": sheet_id}, {"_id": 0})
-    if isinstance(updated_sheet['created_at'], str):
-        updated_sheet['created_at'] = datetime.fromisoformat(updated_sheet['created_at'])
-    if isinstance(updated_sheet['updated_at'], str):
-        updated_sheet['updated_at'] = datetime.fromisoformat(updated_sheet['updated_at'])
+    async def stream():
+        try:
+            yield sse_message({"type": "ready", "data": {"revision": sheet.get('revision', 0), "updated_at": sheet['updated_at']}})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SHEET_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Starlette cancels this generator when the client disconnects
+                    yield b": keepalive\n\n"
+                    continue
+                # A slow client blocks here on the socket; its queue fills and the hub drops it
+                yield sse_message(event)
+                if event['type'] in ('resync', 'sheet.deleted'):
+                    return
+        finally:
+            sheet_events.unsubscribe(sheet_id, queue)
     
-    return ExpenseSheet(**updated_sheet)
+    return StreamingResponse(
+        stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@api_router.delete("/sheets/{sheet_id}/expenses/{expense_id}", response_model=ExpenseSheet)
-async def delete_expense(
+@api_router.get("/sheets/{sheet_id}/expenses", response_model=ExpensePage)
+async def get_expenses(
     sheet_id: str,
-    expense_id: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[List[str]] = Query(None),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    sort: str = Query("date", pattern="^-?(date|amount)$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    await db.expense_sheets.update_one(
+    sheet = await db.expense_sheets.find_one(
         {"id": sheet_id, "user_id": current_user.id},
-        {
-            "$pull": {"expenses": {"id": expense_id}},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-        }
+        {"_id": 0, "id": 1, "user_id": 1}
     )
     
-    updated_sheet = await db.expense_sheets.find_one({"id": sheet_id}, {"_id": 0})
-    if not updated_sheet:
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "categories": category,
+        "min_amount": min_amount,
+        "max_amount": max_amount
+    }
+    expenses, next_cursor = await find_expense_page(sheet, filters, sort, limit, cursor)
+    return ExpensePage(items=[expense_document(e) for e in expenses], next_cursor=next_cursor)
+
+def sheet_view_document(sheet: dict, selected: dict, expenses: Optional[list], next_cursor: Optional[str],
+                        stats: Optional[dict]) -> dict:
+    view = {"id": sheet['id']}
+    for name in selected.get('header', []):
+        if name == 'budgets':
+            view[name] = [{"category": b['category'], "allocated": b['allocated']} for b in sheet.get('budgets', [])]
+        elif name == 'monthly_salary':
+            view[name] = sheet.get(name, 0.0)
+        elif name == 'revision':
+            view[name] = sheet.get(name, 0)
+        else:
+            view[name] = sheet[name]
+    if 'expenses' in selected:
+        view['expenses'] = [
+            {"id": e['id'], **{
+                name: format_expense_date(e[name]) if name == 'date' else e[name]
+                for name in selected['expenses']
+            }}
+            for e in expenses
+        ]
+        view['next_cursor'] = next_cursor
+    if stats is not None:
+        view['stats'] = {name: stats[name] for name in selected['stats']}
+    return view
+
+@api_router.get("/sheets/{sheet_id}/view", response_model=SheetView, response_model_exclude_unset=True)
+async def get_sheet_view(
+    sheet_id: str,
+    fields: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[List[str]] = Query(None),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    sort: str = Query("date", pattern="^-?(date|amount)$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    # Everything the sheet page renders in one request: what GET /sheets/{id},
+    # GET /sheets/{id}/expenses and GET /sheets/{id}/stats return separately
+    selected = parse_view_fields(fields)
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "categories": category,
+        "min_amount": min_amount,
+        "max_amount": max_amount
+    }
+    result = await find_sheet_view(sheet_id, current_user.id, selected, filters, sort, limit, cursor)
+    if result is None:
         raise HTTPException(status_code=404, detail="Sheet not found")
+    sheet, expenses, next_cursor = result
     
-    if isinstance(updated_sheet['created_at'], str):
-        updated_sheet['created_at'] = datetime.fromisoformat(updated_sheet['created_at'])
-    if isinstance(updated_sheet['updated_at'], str):
-        updated_sheet['updated_at'] = datetime.fromisoformat(updated_sheet['updated_at'])
+    stats = None
+    if 'stats' in selected:
+        total, by_category, count = (await load_sheet_stats([sheet]))[sheet_id]
+        stats = sheet_stats_document(sheet, total, by_category, count)
     
-    return ExpenseSheet(**updated_sheet)
+    return ORJSONResponse(sheet_view_document(sheet, selected, expenses, next_cursor, stats))
+
+@api_router.get("/search", response_model=SearchPage)
+async def search_expenses(
+    q: str = Query(..., max_length=200),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    # Matches descriptions and categories across all of the user's sheets; the
+    # last word may be partial, so the same endpoint serves type-ahead
+    words = search_words(q)
+    if not words:
+        return SearchPage(items=[])
+    
+    hits, next_cursor = await find_search_page(current_user.id, words, date_from, date_to, limit, cursor)
+    return SearchPage(
+        items=[
+            SearchHit(
+                sheet_id=hit['sheet_id'],
+                sheet_name=hit['sheet_name'],
+                month=hit['month'],
+                expense=expense_document(hit),
+                score=hit['score']
+            )
+            for hit in hits
+        ],
+        next_cursor=next_cursor
+    )
+
+# Export endpoint
+EXPORT_COLUMNS = ["sheet_id", "sheet_name", "month", "expense_id", "date", "category", "description", "amount"]
+
+@api_router.get("/export/expenses")
+async def export_expenses(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sheet_id: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    query = {"user_id": current_user.id}
+    if sheet_id:
+        query["id"] = {"$in": sheet_id}
+    sheets = await db.expense_sheets.find(
+        query,
+        {"_id": 0, "id": 1, "user_id": 1, "name": 1, "month": 1}
+    ).sort([("created_at", 1), ("id", 1)]).to_list(None)
+    filters = {"date_from": date_from, "date_to": date_to}
+    
+    async def rows():
+        # Rows are flushed every 500 so memory stays flat; a dropped client stops the scan
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == 'csv':
+            writer.writerow(EXPORT_COLUMNS)
+        pending = 0
+        for sheet in sheets:
+            async for expense in iter_sheet_expenses(sheet, filters):
+                values = [
+                    sheet['id'], sheet['name'], sheet['month'], expense['id'],
+                    format_expense_date(expense['date']), expense['category'], expense['description'],
+                    expense['amount']
+                ]
+                if format == 'csv':
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))) + "\n")
+                
+                pending += 1
+                if pending >= 500:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+                    if await request.is_disconnected():
+                        return
+        yield buffer.getvalue()
+    
+    media_type = "text/csv" if format == 'csv' else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=expenses_export.{format}"}
+    )
 
 # Statistics endpoint
 @api_router.get("/sheets/{sheet_id}/stats", response_model=ExpenseStats)
-async def get_stats(sheet_id: str, current_user: User = Depends(get_current_user)):
+async def get_stats(
+    sheet_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        versions = await find_sheet_versions(current_user.id, [sheet_id])
+        etag = versions and sheets_etag("stats", versions)
+        if etag and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=etag_headers(etag))
+    
     sheet = await db.expense_sheets.find_one(
         {"id": sheet_id, "user_id": current_user.id},
-        {"_id": 0}
+        {"_id": 0, "expenses": 0}
     )
     
     if not sheet:
         raise HTTPException(status_code=404, detail="Sheet not found")
+    response.headers.update(etag_headers(sheets_etag("stats", [sheet])))
     
-    expenses = sheet.get('expenses', [])
-    total = sum(e['amount'] for e in expenses)
-    
-    by_category = {}
-    for expense in expenses:
-        category = expense['category']
-        by_category[category] = by_category.get(category, 0) + expense['amount']
-    
-    # Calculate budget info
-    budgets = sheet.get('budgets', [])
-    total_budget = sum(b['allocated'] for b in budgets)
-    
-    # Find overspent categories
-    overspent_categories = []
-    for budget in budgets:
-        spent = by_category.get(budget['category'], 0)
-        if spent > budget['allocated']:
-            overspent_categories.append({
-                'category': budget['category'],
-                'budget': budget['allocated'],
-                'spent': spent,
-                'overspent': spent - budget['allocated']
-            })
-    
-    remaining_budget = sheet.get('monthly_salary', 0) - total
-    
-    return ExpenseStats(
-        total=total,
-        by_category=by_category,
-        count=len(expenses),
-        remaining_budget=remaining_budget,
-        total_budget=total_budget,
-        overspent_categories=overspent_categories
-    )
+    total, by_category, count = (await load_sheet_stats([sheet]))[sheet_id]
+    return ExpenseStats(**sheet_stats_document(sheet, total, by_category, count))
+
+def sheet_stats_document(sheet: dict, total: float, by_category: dict, count: int) -> dict:
+    # Sheets summed on the fly by load_sheet_stats carry no stats.budgets
+    allocations = sheet['stats'].get('budgets') or budget_allocations(sheet.get('budgets', []))
+    return {
+        "total": total,
+        "by_category": by_category,
+        "count": count,
+        "remaining_budget": sheet.get('monthly_salary', 0) - total,
+        "total_budget": sum(allocations.values()),
+        "overspent_categories": overspent_categories(sheet['stats'], allocations)
+    }
 
 # Comparison endpoint
 @api_router.get("/sheets/compare/{sheet1_id}/{sheet2_id}", response_model=ComparisonData)
 async def compare_sheets(
     sheet1_id: str,
     sheet2_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        versions = await find_sheet_versions(current_user.id, [sheet1_id, sheet2_id])
+        etag = versions and sheets_etag("compare", versions)
+        if etag and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=etag_headers(etag))
+    
     sheet1 = await db.expense_sheets.find_one(
         {"id": sheet1_id, "user_id": current_user.id},
         {"_id": 0}
@@ -397,26 +2817,12 @@ async def compare_sheets(
     
     if not sheet1 or not sheet2:
         raise HTTPException(status_code=404, detail="One or both sheets not found")
-    
-    # Convert datetime strings
-    for sheet in [sheet1, sheet2]:
-        if isinstance(sheet['created_at'], str):
-            sheet['created_at'] = datetime.fromisoformat(sheet['created_at'])
-        if isinstance(sheet['updated_at'], str):
-            sheet['updated_at'] = datetime.fromisoformat(sheet['updated_at'])
+    await attach_expenses([sheet1, sheet2])
     
     # Calculate totals
-    total1 = sum(e['amount'] for e in sheet1.get('expenses', []))
-    total2 = sum(e['amount'] for e in sheet2.get('expenses', []))
-    
-    # Calculate by category
-    cat1 = {}
-    for e in sheet1.get('expenses', []):
-        cat1[e['category']] = cat1.get(e['category'], 0) + e['amount']
-    
-    cat2 = {}
-    for e in sheet2.get('expenses', []):
-        cat2[e['category']] = cat2.get(e['category'], 0) + e['amount']
+    sheet_stats = await load_sheet_stats([sheet1, sheet2])
+    total1, cat1, count1 = sheet_stats[sheet1_id]
+    total2, cat2, count2 = sheet_stats[sheet2_id]
     
     # Calculate differences
     all_categories = set(cat1.keys()) | set(cat2.keys())
@@ -445,33 +2851,218 @@ async def compare_sheets(
         },
         "categories": category_comparison,
         "count": {
-            "sheet1": len(sheet1.get('expenses', [])),
-            "sheet2": len(sheet2.get('expenses', []))
+            "sheet1": count1,
+            "sheet2": count2
         }
     }
     
-    return ComparisonData(
-        sheet1=ExpenseSheet(**sheet1),
-        sheet2=ExpenseSheet(**sheet2),
-        comparison=comparison
+    return ORJSONResponse(
+        {"sheet1": sheet_document(sheet1), "sheet2": sheet_document(sheet2), "comparison": comparison},
+        headers=etag_headers(sheets_etag("compare", [sheet1, sheet2]))
     )
 
-# PDF Generation endpoint
-@api_router.get("/sheets/{sheet_id}/pdf")
-async def generate_pdf(sheet_id: str, current_user: User = Depends(get_current_user)):
-    sheet = await db.expense_sheets.find_one(
-        {"id": sheet_id, "user_id": current_user.id},
-        {"_id": 0}
+COMPARE_MAX_SHEETS = 120
+
+def series_changes(values: np.ndarray):
+    # Point-over-point deltas and percent changes along the last axis, for every
+    # row at once. Percent change follows compare_sheets: 100 when growing from zero.
+    previous, current = values[..., :-1], values[..., 1:]
+    delta = current - previous
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(previous > 0, delta / previous * 100, np.where(current > 0, 100.0, 0.0))
+    return delta, np.round(percent, 2)
+
+def comparison_series(values, delta, percent) -> ComparisonSeries:
+    return ComparisonSeries(
+        values=values.tolist(),
+        delta=[None, *delta.tolist()],
+        percent_change=[None, *percent.tolist()]
     )
+
+@api_router.get("/compare", response_model=SeriesComparison)
+async def compare_series(
+    sheet_id: Optional[List[str]] = Query(None),
+    month_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    month_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    include_sheets: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    # Compares any number of sheets: the ids given, in that order, or every sheet
+    # whose month falls in [month_from, month_to], in month order
+    if sheet_id:
+        query = {"user_id": current_user.id, "id": {"$in": sheet_id}}
+    elif month_from or month_to:
+        month_range = {}
+        if month_from:
+            month_range["$gte"] = month_from
+        if month_to:
+            month_range["$lte"] = month_to
+        query = {"user_id": current_user.id, "month": month_range}
+    else:
+        raise HTTPException(status_code=400, detail="Provide sheet_id values or a month range")
+    
+    projection = {"_id": 0} if include_sheets else {"_id": 0, "expenses": 0}
+    sheets = await db.expense_sheets.find(query, projection).sort(
+        [("month", 1), ("created_at", 1)]
+    ).to_list(COMPARE_MAX_SHEETS + 1)
+    if len(sheets) > COMPARE_MAX_SHEETS:
+        raise HTTPException(status_code=400, detail=f"At most {COMPARE_MAX_SHEETS} sheets can be compared")
+    if sheet_id:
+        by_id = {sheet['id']: sheet for sheet in sheets}
+        if len(by_id) != len(set(sheet_id)):
+            raise HTTPException(status_code=404, detail="One or more sheets not found")
+        sheets = [by_id[i] for i in dict.fromkeys(sheet_id)]
+    
+    sheet_stats = await load_sheet_stats(sheets) if sheets else {}
+    categories = sorted({cat for total, by_category, count in sheet_stats.values() for cat in by_category})
+    
+    # categories x sheets, plus the totals as the last row, so one pass covers both
+    matrix = np.zeros((len(categories) + 1, len(sheets)))
+    for column, sheet in enumerate(sheets):
+        total, by_category, count = sheet_stats[sheet['id']]
+        for row, cat in enumerate(categories):
+            matrix[row, column] = by_category.get(cat, 0)
+        matrix[-1, column] = total
+    delta, percent = series_changes(matrix)
+    
+    if include_sheets:
+        await attach_expenses(sheets)
+    
+    return SeriesComparison(
+        sheet_ids=[sheet['id'] for sheet in sheets],
+        months=[sheet['month'] for sheet in sheets],
+        counts=[sheet_stats[sheet['id']][2] for sheet in sheets],
+        total=comparison_series(matrix[-1], delta[-1], percent[-1]),
+        categories={
+            cat: comparison_series(matrix[row], delta[row], percent[row])
+            for row, cat in enumerate(categories)
+        },
+        sheets=[ExpenseSheet(**sheet_document(sheet)) for sheet in sheets] if include_sheets else None
+    )
+
+@api_router.get("/budgets/overspent", response_model=List[OverspentCategory])
+async def get_overspent(
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    current_user: User = Depends(get_current_user)
+):
+    # Defaults to the current month's sheets
+    rows = await find_overspending(current_user.id, month or utc_now().strftime('%Y-%m'))
+    return [OverspentCategory(**row) for row in rows]
+
+# Cross-sheet analytics, served from the rollups collection
+@api_router.get("/analytics/rollups", response_model=RollupReport)
+async def get_rollups(
+    month_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    month_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    granularity: str = Query("month", pattern="^(month|year)$"),
+    category: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    query = {"user_id": current_user.id, "count": {"$gt": 0}}
+    if month_from or month_to:
+        query["month"] = {}
+        if month_from:
+            query["month"]["$gte"] = month_from
+        if month_to:
+            query["month"]["$lte"] = month_to
+    if category:
+        query["category"] = {"$in": category}
+    
+    # At most one document per month and category, so even decades of data is a small read
+    periods = {}
+    months = set()
+    cursor = db.rollups.find(query, {"_id": 0, "month": 1, "category": 1, "total": 1, "count": 1}).sort("month", 1)
+    async for rollup in cursor:
+        months.add(rollup['month'])
+        key = rollup['month'] if granularity == 'month' else rollup['month'][:4]
+        period = periods.setdefault(key, {"period": key, "total": 0.0, "count": 0, "by_category": {}})
+        period['total'] += rollup['total']
+        period['count'] += rollup['count']
+        period['by_category'][rollup['category']] = period['by_category'].get(rollup['category'], 0) + rollup['total']
+    
+    total = sum(period['total'] for period in periods.values())
+    return RollupReport(
+        granularity=granularity,
+        periods=[RollupPeriod(**period) for period in periods.values()],
+        total=total,
+        count=sum(period['count'] for period in periods.values()),
+        months=len(months),
+        average_monthly=total / len(months) if months else 0.0
+    )
+
+# Spending trends, computed as group-bys over the columnar expense cache
+def expense_trends(columns: ExpenseColumns, granularity: str, day_from: Optional[int] = None,
+                   day_to: Optional[int] = None, categories: Optional[List[str]] = None,
+                   sheet_ids: Optional[List[str]] = None) -> dict:
+    # Rows whose date never parsed cannot be placed in a period and are left out
+    mask = columns.days >= 0
+    if day_from is not None:
+        mask &= columns.days >= day_from
+    if day_to is not None:
+        mask &= columns.days <= day_to
+    if categories:
+        mask &= np.isin(columns.codes, [columns.category_codes[c] for c in categories if c in columns.category_codes])
+    if sheet_ids:
+        wanted = set(sheet_ids)
+        positions = [i for i, sheet_id in enumerate(columns.sheet_ids) if sheet_id in wanted]
+        mask &= np.isin(columns.sheet_index, positions)
+    days, codes, cents = columns.days[mask], columns.codes[mask], columns.cents[mask]
+    
+    if granularity == 'day':
+        keys = days.astype('datetime64[D]')
+    elif granularity == 'week':
+        # Day 0 was a Thursday, so (day + 3) % 7 is the weekday counted from Monday
+        keys = (days - (days + 3) % 7).astype('datetime64[D]')
+    else:
+        keys = days.astype('datetime64[D]').astype('datetime64[M]')
+    periods, inverse = np.unique(keys, return_inverse=True)
+    
+    width = len(columns.categories)
+    counts = np.bincount(inverse, minlength=len(periods))
+    by_category = np.bincount(
+        inverse * width + codes, weights=cents, minlength=len(periods) * width
+    ).reshape(len(periods), width)
+    totals = by_category.sum(axis=1)
+    
+    return {
+        "granularity": granularity,
+        "periods": [
+            {
+                "period": label,
+                "total": totals[row] / 100,
+                "count": int(counts[row]),
+                "by_category": {
+                    columns.categories[code]: by_category[row, code] / 100 for code in np.flatnonzero(by_category[row])
+                }
+            }
+            for row, label in enumerate(np.datetime_as_string(periods))
+        ],
+        "total": int(cents.sum()) / 100,
+        "count": len(cents)
+    }
+
+@api_router.get("/analytics/trends", response_model=TrendReport)
+async def get_trends(
+    date_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    date_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    granularity: str = Query("week", pattern="^(day|week|month)$"),
+    category: Optional[List[str]] = Query(None),
+    sheet_id: Optional[List[str]] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        day_from = day_number(parse_expense_date(date_from)) if date_from else None
+        day_to = day_number(parse_expense_date(date_to)) if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date_from and date_to must be valid dates")
     
-    if not sheet:
-        raise HTTPException(status_code=404, detail="Sheet not found")
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    columns = await expense_columns.get(current_user.id)
+    return TrendReport(**expense_trends(columns, granularity, day_from, day_to, category, sheet_id))
+
+# PDF Generation endpoint
+def report_summary_flowables(sheet: dict, total: float, by_category: dict, count: int, styles) -> list:
+    # Title, summary and category breakdown shared by both report layouts
     elements = []
-    
-    styles = getSampleStyleSheet()
     title_style = ParagraphStyle(
         'CustomTitle',
         parent=styles['Heading1'],
@@ -487,12 +3078,9 @@ async def generate_pdf(sheet_id: str, current_user: User = Depends(get_current_u
     elements.append(Spacer(1, 20))
     
     # Summary
-    expenses = sheet.get('expenses', [])
-    total = sum(e['amount'] for e in expenses)
-    
     summary_data = [
         ['Total Expenses:', f'${total:.2f}'],
-        ['Number of Transactions:', str(len(expenses))],
+        ['Number of Transactions:', str(count)],
     ]
     
     summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
@@ -513,11 +3101,6 @@ async def generate_pdf(sheet_id: str, current_user: User = Depends(get_current_u
     elements.append(Paragraph("Breakdown by Category", styles['Heading2']))
     elements.append(Spacer(1, 10))
     
-    by_category = {}
-    for expense in expenses:
-        category = expense['category']
-        by_category[category] = by_category.get(category, 0) + expense['amount']
-    
     category_data = [['Category', 'Amount', 'Percentage']]
     for cat, amount in sorted(by_category.items(), key=lambda x: x[1], reverse=True):
         percentage = (amount / total * 100) if total > 0 else 0
@@ -538,19 +3121,31 @@ async def generate_pdf(sheet_id: str, current_user: User = Depends(get_current_u
     
     elements.append(category_table)
     elements.append(Spacer(1, 30))
+    return elements
+
+def transaction_row(expense: dict) -> list:
+    return [
+        format_expense_date(expense['date']),
+        expense['category'],
+        expense['description'][:30] + '...' if len(expense['description']) > 30 else expense['description'],
+        f"${expense['amount']:.2f}"
+    ]
+
+def render_sheet_pdf(sheet: dict, total: float, by_category: dict, count: int, expenses: list) -> bytes:
+    # Runs in a pdf_pool worker process; everything it needs arrives as plain data
+    buffer = BytesIO()
+    # invariant output makes the bytes a pure function of the data, so the ETag can be strong
+    doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=True)
+    styles = getSampleStyleSheet()
+    elements = report_summary_flowables(sheet, total, by_category, count, styles)
     
     # Detailed transactions
     elements.append(Paragraph("Detailed Transactions", styles['Heading2']))
     elements.append(Spacer(1, 10))
     
     transaction_data = [['Date', 'Category', 'Description', 'Amount']]
-    for expense in sorted(expenses, key=lambda x: x['date']):
-        transaction_data.append([
-            expense['date'],
-            expense['category'],
-            expense['description'][:30] + '...' if len(expense['description']) > 30 else expense['description'],
-            f"${expense['amount']:.2f}"
-        ])
+    for expense in sorted(expenses, key=lambda x: format_expense_date(x['date'])):
+        transaction_data.append(transaction_row(expense))
     
     transaction_table = Table(transaction_data, colWidths=[1.2*inch, 1.5*inch, 2.3*inch, 1*inch])
     transaction_table.setStyle(TableStyle([
@@ -568,13 +3163,180 @@ async def generate_pdf(sheet_id: str, current_user: User = Depends(get_current_u
     elements.append(transaction_table)
     
     doc.build(elements)
-    buffer.seek(0)
+    return buffer.getvalue()
+
+class StreamedFlowables(list):
+    # doc.build() consumes flowables from the front and re-checks len() before each
+    # one, so topping the list up there keeps only a page or two alive at a time
+    def __init__(self, head: list, pages):
+        super().__init__(head)
+        self.pages = pages
+    
+    def __len__(self):
+        while list.__len__(self) < 2:
+            try:
+                self.extend(next(self.pages))
+            except StopIteration:
+                break
+        return list.__len__(self)
+
+worker_mongo_client = None
+
+def worker_expense_stream(sheet: dict, db_name: str):
+    # Synchronous counterpart of iter_sheet_expenses for use inside pdf_pool workers
+    global worker_mongo_client
+    if worker_mongo_client is None:
+        worker_mongo_client = MongoClient(mongo_url, tz_aware=True)
+    collection, pipeline = sheet_expense_pipeline(sheet)
+    with worker_mongo_client[db_name][collection].aggregate(pipeline, allowDiskUse=True, batchSize=1000) as cursor:
+        yield from cursor
+
+def large_report_pages(expenses, rows_per_page: int):
+    # One LongTable per page, closed by that page's subtotal and the running total
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -2), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+        ('BACKGROUND', (0, 1), (-1, -3), colors.beige),
+        ('BACKGROUND', (0, -2), (-1, -1), colors.HexColor('#f3f4f6')),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+    ])
+    running_total = 0.0
+    page_rows, page_total = [], 0.0
+    
+    def page():
+        data = [['Date', 'Category', 'Description', 'Amount'], *page_rows,
+                ['', '', 'Page subtotal', f'${page_total:.2f}'],
+                ['', '', 'Running total', f'${running_total:.2f}']]
+        table = LongTable(data, colWidths=[1.2*inch, 1.5*inch, 2.3*inch, 1*inch],
+                          rowHeights=LARGE_REPORT_ROW_HEIGHT, repeatRows=1)
+        table.setStyle(style)
+        return [table, PageBreak()]
     
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=expense_report_{sheet['month']}.pdf"}
+    for expense in expenses:
+        page_rows.append(transaction_row(expense))
+        page_total += expense['amount']
+        running_total += expense['amount']
+        if len(page_rows) == rows_per_page:
+            yield page()
+            page_rows, page_total = [], 0.0
+    if page_rows:
+        yield page()
+
+def number_page(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, doc.bottomMargin / 2, f"Page {doc.page}")
+    canvas.restoreState()
+
+def render_large_sheet_pdf(sheet: dict, total: float, by_category: dict, count: int, db_name: str) -> bytes:
+    # Runs in a pdf_pool worker; transactions are read from MongoDB already in date order
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=True)
+    styles = getSampleStyleSheet()
+    head = report_summary_flowables(sheet, total, by_category, count, styles)
+    head += [PageBreak(), Paragraph("Detailed Transactions", styles['Heading2'])]
+    
+    # Fixed row heights let each chunk fill exactly one page; the spare rows hold the
+    # column header, the two total rows and the section heading on the first page
+    rows_per_page = int(doc.height // LARGE_REPORT_ROW_HEIGHT) - 6
+    pages = large_report_pages(worker_expense_stream(sheet, db_name), rows_per_page)
+    doc.build(StreamedFlowables(head, pages), onFirstPage=number_page, onLaterPages=number_page)
+    return buffer.getvalue()
+
+@asynccontextmanager
+async def pdf_render_slot(user_id: str):
+    global pdf_renders_in_flight
+    if pdf_renders_by_user.get(user_id, 0) >= PDF_MAX_PER_USER:
+        raise HTTPException(
+            status_code=429,
+            detail="A report is already being generated, please wait for it to finish",
+            headers={"Retry-After": "2"}
+        )
+    if pdf_renders_in_flight >= PDF_POOL_SIZE + PDF_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=503,
+            detail="Report generation is busy, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    
+    pdf_renders_in_flight += 1
+    pdf_renders_by_user[user_id] = pdf_renders_by_user.get(user_id, 0) + 1
+    try:
+        yield
+    finally:
+        pdf_renders_in_flight -= 1
+        pdf_renders_by_user[user_id] -= 1
+        if not pdf_renders_by_user[user_id]:
+            del pdf_renders_by_user[user_id]
+
+def pdf_cache_key(sheet: dict, layout: str) -> str:
+    return hashlib.sha256(
+        f"{PDF_REPORT_VERSION}|{layout}|{sheet['id']}|{sheet.get('revision', 0)}|{sheet['updated_at']}".encode()
+    ).hexdigest()[:32]
+
+def pdf_headers(sheet: dict, cache_key: str) -> dict:
+    return {
+        "ETag": f'"{cache_key}"',
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename=expense_report_{sheet['month']}.pdf"
+    }
+
+@api_router.get("/sheets/{sheet_id}/pdf")
+async def generate_pdf(
+    sheet_id: str,
+    request: Request,
+    layout: Optional[str] = Query(None, pattern="^(standard|large)$"),
+    current_user: User = Depends(get_current_user)
+):
+    sheet = await db.expense_sheets.find_one(
+        {"id": sheet_id, "user_id": current_user.id},
+        {"_id": 0, "expenses": 0}
     )
+    
+    if not sheet:
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    
+    if layout is None:
+        count = sheet['stats']['count'] if sheet.get('stats') else 0
+        layout = 'large' if count > PDF_LARGE_REPORT_THRESHOLD else 'standard'
+    
+    cache_key = pdf_cache_key(sheet, layout)
+    if etag_matches(request.headers.get('if-none-match'), f'"{cache_key}"'):
+        return Response(status_code=304, headers=pdf_headers(sheet, cache_key))
+    
+    pdf = await asyncio.to_thread(pdf_cache.get, cache_key)
+    if pdf is None:
+        async with pdf_render_slot(current_user.id):
+            loop = asyncio.get_running_loop()
+            # Re-read once the slot is held, since the sheet may have changed while
+            # queued; the key follows whatever version is rendered
+            projection = {"_id": 0, "expenses": 0} if layout == 'large' else {"_id": 0}
+            sheet = await db.expense_sheets.find_one({"id": sheet_id, "user_id": current_user.id}, projection)
+            if not sheet:
+                raise HTTPException(status_code=404, detail="Sheet not found")
+            cache_key = pdf_cache_key(sheet, layout)
+            if layout == 'large':
+                total, by_category, count = (await load_sheet_stats([sheet]))[sheet_id]
+                pdf = await loop.run_in_executor(
+                    pdf_pool, render_large_sheet_pdf, sheet, total, by_category, count, db.name
+                )
+            else:
+                await attach_expenses([sheet])
+                total, by_category, count = (await load_sheet_stats([sheet]))[sheet_id]
+                expenses = sheet.pop('expenses', [])
+                pdf = await loop.run_in_executor(
+                    pdf_pool, render_sheet_pdf, sheet, total, by_category, count, expenses
+                )
+        await asyncio.to_thread(pdf_cache.put, cache_key, pdf)
+    
+    return Response(content=pdf, media_type="application/pdf", headers=pdf_headers(sheet, cache_key))
 
 app.include_router(api_router)
 
@@ -584,6 +3346,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 logging.basicConfig(
@@ -592,6 +3355,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def prepare_database():
+    version = await bootstrap_schema()
+    logger.info(f"Database schema at version {version}")
+    
+    if EXPENSE_STORAGE == 'collection':
+        migrated = await migrate_embedded_expenses()
+        if migrated:
+            logger.info(f"Migrated {migrated} embedded expenses into the expenses collection")
+    
+    # Held on app.state so the tasks are not garbage collected while they run
+    app.state.datetime_migration = asyncio.create_task(migrate_datetimes())
+    app.state.datetime_migration.add_done_callback(log_datetime_migration)
+    app.state.search_index = asyncio.create_task(build_search_index())
+    app.state.search_index.add_done_callback(log_search_index)
+
+def log_datetime_migration(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error("Datetime migration failed; it resumes on the next start", exc_info=task.exception())
+    elif any(task.result().values()):
+        logger.info(f"Converted string datetimes: {task.result()}")
+
+def log_search_index(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error("Search index backfill failed; it resumes on the next start", exc_info=task.exception())
+    elif task.result():
+        logger.info(f"Indexed {task.result()} expenses for search")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_password_pool():
+    password_pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def shutdown_pdf_pool():
+    pdf_pool.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
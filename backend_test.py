@@ -150,6 +150,19 @@ class ExpenseTrackerAPITester:
             return True, response
         return False, []
 
+    def test_get_sheet_summaries(self):
+        """Test lightweight sheet listing"""
+        success, response = self.run_test(
+            "Get Sheet Summaries",
+            "GET",
+            "sheets/summary?limit=1",
+            200
+        )
+        
+        if success and 'items' in response and all('expenses' not in s for s in response['items']):
+            return True
+        return False
+
     def test_get_sheet(self, sheet_id):
         """Test getting specific sheet"""
         success, response = self.run_test(
@@ -161,6 +174,22 @@ class ExpenseTrackerAPITester:
         
         return success, response
 
+    def test_conditional_get_sheet(self, sheet_id):
+        """Test that an unchanged sheet is answered with 304"""
+        url = f"{self.api_url}/sheets/{sheet_id}"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        
+        try:
+            etag = requests.get(url, headers=headers).headers.get('ETag')
+            response = requests.get(url, headers={**headers, 'If-None-Match': etag or ''})
+            success = etag is not None and response.status_code == 304
+            
+            self.log_test("Conditional Get Sheet", success, f"ETag: {etag}, Status: {response.status_code}")
+            return success
+        except Exception as e:
+            self.log_test("Conditional Get Sheet", False, f"Exception: {str(e)}")
+            return False
+
     def test_add_expense(self, sheet_id):
         """Test adding expense to sheet"""
         expense_data = {
@@ -182,6 +211,27 @@ class ExpenseTrackerAPITester:
             return True, response['expenses'][0]['id']
         return False, None
 
+    def test_add_expense_delta(self, sheet_id):
+        """Test adding an expense with the delta response"""
+        expense_data = {
+            "date": "2024-01-16",
+            "category": "Transport",
+            "description": "Bus pass",
+            "amount": 45.00
+        }
+        
+        success, response = self.run_test(
+            "Add Expense (delta view)",
+            "POST",
+            f"sheets/{sheet_id}/expenses?view=delta",
+            200,
+            data=expense_data
+        )
+        
+        if success and 'expense' in response and 'total' in response and 'expenses' not in response:
+            return True
+        return False
+
     def test_update_expense(self, sheet_id, expense_id):
         """Test updating expense"""
         updated_expense = {
@@ -201,6 +251,70 @@ class ExpenseTrackerAPITester:
         
         return success, response
 
+    def test_update_conflict(self, sheet_id, expense_id):
+        """Test that an update pinned to a stale revision is refused"""
+        url = f"{self.api_url}/sheets/{sheet_id}/expenses/{expense_id}"
+        headers = {'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+        expense_data = {"date": "2024-01-15", "category": "Food", "description": "Conflict check", "amount": 10.00}
+        
+        try:
+            revision = requests.get(f"{self.api_url}/sheets/{sheet_id}", headers=headers).json()['revision']
+            first = requests.put(url, json=expense_data, headers={**headers, 'If-Match': f'"{revision}"'})
+            second = requests.put(url, json=expense_data, headers={**headers, 'If-Match': f'"{revision}"'})
+            success = first.status_code == 200 and second.status_code == 409
+            
+            self.log_test("Update Conflict", success, f"Statuses: {first.status_code}, {second.status_code}")
+            return success
+        except Exception as e:
+            self.log_test("Update Conflict", False, f"Exception: {str(e)}")
+            return False
+
+    def test_bulk_add_expenses(self, sheet_id):
+        """Test bulk expense ingestion with duplicate detection"""
+        expenses = [
+            {"date": "2024-01-20", "category": "Transport", "description": "Bus pass", "amount": 40.0},
+            {"date": "2024-01-21", "category": "Utilities", "description": "Electricity", "amount": 60.25},
+            {"date": "2024-01-20", "category": "Transport", "description": "Bus pass", "amount": 40.0}
+        ]
+        
+        success, response = self.run_test(
+            "Bulk Add Expenses",
+            "POST",
+            f"sheets/{sheet_id}/expenses/bulk",
+            200,
+            data=expenses
+        )
+        
+        if success and response.get('imported') == 2 and response.get('duplicates') == 1:
+            return True
+        return False
+
+    def test_get_expenses(self, sheet_id):
+        """Test filtered expense listing"""
+        success, response = self.run_test(
+            "Get Filtered Expenses",
+            "GET",
+            f"sheets/{sheet_id}/expenses?category=Food&date_from=2024-01-01&sort=-amount&limit=10",
+            200
+        )
+        
+        if success and 'items' in response and all(e['category'] == 'Food' for e in response['items']):
+            return True
+        return False
+
+    def test_search_expenses(self):
+        """Test prefix search across sheets"""
+        success, response = self.run_test(
+            "Search Expenses",
+            "GET",
+            "search?q=groc&date_from=2024-01-01&limit=5",
+            200
+        )
+        
+        if success and 'items' in response:
+            return any('grocery' in hit['expense']['description'].lower() for hit in response['items'])
+        return False
+
     def test_get_stats(self, sheet_id):
         """Test getting sheet statistics"""
         success, response = self.run_test(
@@ -214,6 +328,19 @@ class ExpenseTrackerAPITester:
             return True
         return False
 
+    def test_get_sheet_view(self, sheet_id):
+        """Test the composite sheet view with sparse fields"""
+        success, response = self.run_test(
+            "Get Sheet View",
+            "GET",
+            f"sheets/{sheet_id}/view?fields=header.name,expenses.amount,stats.total&limit=1",
+            200
+        )
+        
+        if success and set(response) == {'id', 'name', 'expenses', 'next_cursor', 'stats'}:
+            return set(response['stats']) == {'total'}
+        return False
+
     def test_delete_expense(self, sheet_id, expense_id):
         """Test deleting expense"""
         success, response = self.run_test(
@@ -238,6 +365,66 @@ class ExpenseTrackerAPITester:
             return True
         return False
 
+    def test_compare_series(self, sheet1_id, sheet2_id):
+        """Test N-way comparison across sheets"""
+        success, response = self.run_test(
+            "Compare Series",
+            "GET",
+            f"compare?sheet_id={sheet1_id}&sheet_id={sheet2_id}",
+            200
+        )
+        
+        if success and len(response.get('total', {}).get('values', [])) == 2:
+            return True
+        return False
+
+    def test_get_rollups(self):
+        """Test cross-sheet monthly rollups"""
+        success, response = self.run_test(
+            "Get Rollups",
+            "GET",
+            "analytics/rollups?granularity=year",
+            200
+        )
+        
+        if success and 'periods' in response:
+            return True
+        return False
+
+    def test_update_budgets(self, sheet_id):
+        """Test replacing a sheet's budgets"""
+        budgets = {"monthly_salary": 3000, "budgets": [{"category": "Food", "allocated": 10}]}
+        success, response = self.run_test(
+            "Update Budgets",
+            "PUT",
+            f"sheets/{sheet_id}/budgets",
+            200,
+            data=budgets
+        )
+        if not success or response.get('budgets') != budgets['budgets']:
+            return False
+        
+        success, response = self.run_test(
+            "Get Overspent Budgets",
+            "GET",
+            f"budgets/overspent?month={response['month']}",
+            200
+        )
+        return success and isinstance(response, list)
+
+    def test_get_trends(self):
+        """Test weekly spending trends"""
+        success, response = self.run_test(
+            "Get Trends",
+            "GET",
+            "analytics/trends?granularity=week",
+            200
+        )
+        
+        if success and 'periods' in response:
+            return True
+        return False
+
     def test_generate_pdf(self, sheet_id):
         """Test PDF generation"""
         url = f"{self.api_url}/sheets/{sheet_id}/pdf"
@@ -253,6 +440,40 @@ class ExpenseTrackerAPITester:
             self.log_test("Generate PDF", False, f"Exception: {str(e)}")
             return False
 
+    def test_export_expenses(self, sheet_id):
+        """Test streaming CSV export"""
+        url = f"{self.api_url}/export/expenses?format=csv&sheet_id={sheet_id}"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        
+        try:
+            response = requests.get(url, headers=headers, stream=True)
+            first_line = next(response.iter_lines(decode_unicode=True), '')
+            success = response.status_code == 200 and first_line.startswith('sheet_id,sheet_name')
+            
+            self.log_test("Export Expenses", success, f"Status: {response.status_code}, First line: {first_line}")
+            return success
+        except Exception as e:
+            self.log_test("Export Expenses", False, f"Exception: {str(e)}")
+            return False
+
+    def test_sheet_events(self, sheet_id):
+        """Test the sheet change feed"""
+        url = f"{self.api_url}/sheets/{sheet_id}/events"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        
+        try:
+            response = requests.get(url, headers=headers, stream=True, timeout=10)
+            lines = response.iter_lines(decode_unicode=True)
+            event = next((line for line in lines if line.startswith('event:')), '')
+            response.close()
+            success = response.status_code == 200 and event == 'event: ready'
+            
+            self.log_test("Sheet Events", success, f"Status: {response.status_code}, First event: {event}")
+            return success
+        except Exception as e:
+            self.log_test("Sheet Events", False, f"Exception: {str(e)}")
+            return False
+
     def test_delete_sheet(self, sheet_id):
         """Test deleting sheet"""
         success, response = self.run_test(
@@ -303,20 +524,35 @@ class ExpenseTrackerAPITester:
 
         # Test getting sheets
         self.test_get_sheets()
+        self.test_get_sheet_summaries()
         self.test_get_sheet(sheet_id)
+        self.test_conditional_get_sheet(sheet_id)
 
         # Test expense operations
         expense_success, expense_id = self.test_add_expense(sheet_id)
         if expense_success:
             self.test_update_expense(sheet_id, expense_id)
+            self.test_add_expense_delta(sheet_id)
+            self.test_update_conflict(sheet_id, expense_id)
+            self.test_bulk_add_expenses(sheet_id)
+            self.test_get_expenses(sheet_id)
+            self.test_search_expenses()
+            self.test_update_budgets(sheet_id)
             self.test_get_stats(sheet_id)
+            self.test_get_sheet_view(sheet_id)
             
             # Add expense to second sheet for comparison
             if sheet2_id:
                 self.test_add_expense(sheet2_id)
                 self.test_compare_sheets(sheet_id, sheet2_id)
+                self.test_compare_series(sheet_id, sheet2_id)
+            
+            self.test_get_rollups()
+            self.test_get_trends()
             
             self.test_generate_pdf(sheet_id)
+            self.test_export_expenses(sheet_id)
+            self.test_sheet_events(sheet_id)
             self.test_delete_expense(sheet_id, expense_id)
 
         # Cleanup
@@ -0,0 +1,95 @@
+"""Trend analytics: Python loops over expense dicts vs. the columnar cache.
+
+The dict path is how analytics used to work: walk every expense of every sheet,
+parse its date and accumulate per-period and per-category totals in dicts. The
+columnar path is server.expense_trends over an ExpenseColumns built from the
+same documents. Building the columns is timed separately; it happens once per
+user and again only for sheets that change. No database is needed.
+
+    python benchmarks/analytics_columns.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+CATEGORIES = ["Food", "Rent", "Transport", "Utilities", "Entertainment", "Health", "Shopping", "Other"]
+EXPENSES_PER_SHEET = 500
+START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+def make_sheets(count: int) -> dict:
+    # {sheet_id: expenses}, stored-shape documents spread over consecutive months
+    sheets = {}
+    for start in range(0, count, EXPENSES_PER_SHEET):
+        sheets[str(uuid.uuid4())] = [
+            {
+                "date": START + timedelta(days=i // 16),
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "amount": round((i % 500) + 0.99, 2),
+            }
+            for i in range(start, min(start + EXPENSES_PER_SHEET, count))
+        ]
+    return sheets
+
+
+def dict_trends(sheets: dict) -> dict:
+    periods = {}
+    for expenses in sheets.values():
+        for expense in expenses:
+            day = expense["date"].date()
+            key = (day - timedelta(days=day.weekday())).isoformat()
+            period = periods.setdefault(key, {"period": key, "total": 0.0, "count": 0, "by_category": {}})
+            period["total"] += expense["amount"]
+            period["count"] += 1
+            period["by_category"][expense["category"]] = period["by_category"].get(expense["category"], 0) + expense["amount"]
+    return dict(sorted(periods.items()))
+
+
+def build_columns(sheets: dict) -> server.ExpenseColumns:
+    columns = server.ExpenseColumns()
+    columns.rebuild({sheet_id: (0, None) for sheet_id in sheets}, sheets)
+    return columns
+
+
+def timed(func, *args, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'expenses':>10}{'dict ms':>10}{'build ms':>10}{'columns ms':>12}{'speedup':>10}{'cache KB':>10}")
+    for size in args.sizes:
+        sheets = make_sheets(size)
+        columns = build_columns(sheets)
+        assert len(server.expense_trends(columns, "week")["periods"]) == len(dict_trends(sheets))
+        dict_ms = timed(dict_trends, sheets, repeat=args.repeat)
+        build_ms = timed(build_columns, sheets, repeat=args.repeat)
+        columns_ms = timed(server.expense_trends, columns, "week", repeat=args.repeat)
+        print(
+            f"{size:>10}{dict_ms:>10.1f}{build_ms:>10.1f}{columns_ms:>12.1f}"
+            f"{dict_ms / columns_ms:>9.1f}x{columns.nbytes / 1024:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Event-loop latency while a login storm is running.
+
+Compares calling bcrypt inline in the handler (the old behaviour) with handing
+it to the password pool. A ticker coroutine sleeps for a fixed interval and
+records how late it wakes up; that lag is what every other request on the
+worker would see.
+
+    python benchmarks/auth_event_loop.py --logins 40
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+TICK_SECONDS = 0.005
+
+
+async def measure_lag(stop: asyncio.Event) -> list:
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append((time.perf_counter() - started - TICK_SECONDS) * 1000)
+    return lags
+
+
+async def inline_login(password: str, hashed: str):
+    return server.verify_and_update_password(password, hashed)
+
+
+async def pooled_login(password: str, hashed: str):
+    try:
+        return await server.run_password_task(server.verify_and_update_password, password, hashed)
+    except server.HTTPException:
+        return None  # Shed with a 503
+
+
+async def storm(login, logins: int, hashed: str) -> dict:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login("correct horse", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lags = sorted(await ticker) or [0.0]
+    return {
+        "logins": logins,
+        "shed": sum(1 for r in results if r is None),
+        "wall_s": elapsed,
+        "lag_p50_ms": statistics.median(lags),
+        "lag_p99_ms": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+        "lag_max_ms": lags[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    args = parser.parse_args()
+
+    hashed = server.hash_password("correct horse")
+    print(f"bcrypt rounds={server.BCRYPT_ROUNDS} pool={server.PASSWORD_POOL_KIND}x{server.PASSWORD_POOL_SIZE} "
+          f"queue_limit={server.PASSWORD_QUEUE_LIMIT}")
+    print(f"{'mode':<8}{'logins':>8}{'shed':>6}{'wall s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, login in (("inline", inline_login), ("pooled", pooled_login)):
+        r = asyncio.run(storm(login, args.logins, hashed))
+        print(f"{name:<8}{r['logins']:>8}{r['shed']:>6}{r['wall_s']:>9.2f}"
+              f"{r['lag_p50_ms']:>9.1f}{r['lag_p99_ms']:>9.1f}{r['lag_max_ms']:>9.1f}")
+    server.password_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
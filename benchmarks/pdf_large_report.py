@@ -0,0 +1,101 @@
+"""PDF render time and peak memory: standard layout vs. the large-report layout.
+
+The standard layout receives every expense from the request process and builds
+one Table; the large layout streams rows from MongoDB inside the worker and
+lays them out a page at a time. Each render runs in a fresh child process so
+its peak RSS is measured in isolation. Needs a live MongoDB at MONGO_URL;
+everything is written to a throwaway database that is dropped after.
+
+    python benchmarks/pdf_large_report.py --sizes 1000 10000 50000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+
+CATEGORIES = ["Food", "Rent", "Transport", "Utilities", "Entertainment", "Health", "Shopping", "Other"]
+USER_ID = "benchmark-user"
+
+
+def make_expenses(count: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "date": datetime(2024, 1, i % 28 + 1, tzinfo=timezone.utc),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "description": f"Transaction {i} at a merchant with a longish name",
+            "amount": round((i % 500) + 0.99, 2),
+        }
+        for i in range(count)
+    ]
+
+
+def seed(db, count: int) -> dict:
+    expenses = make_expenses(count)
+    sheet = {"id": str(uuid.uuid4()), "user_id": USER_ID, "name": "Bench", "month": "2024-01"}
+    if server.EXPENSE_STORAGE == "collection":
+        db.expenses.insert_many([{**e, "user_id": USER_ID, "sheet_id": sheet["id"]} for e in expenses])
+        db.expense_sheets.insert_one(dict(sheet))
+    else:
+        db.expense_sheets.insert_one({**sheet, "expenses": expenses})
+    by_category = {}
+    for expense in expenses:
+        by_category[expense["category"]] = by_category.get(expense["category"], 0) + expense["amount"]
+    return sheet, expenses, sum(by_category.values()), by_category
+
+
+def render(layout: str, sheet: dict, total: float, by_category: dict, count: int, expenses, db_name: str):
+    started = time.perf_counter()
+    if layout == "large":
+        pdf = server.render_large_sheet_pdf(sheet, total, by_category, count, db_name)
+    else:
+        pdf = server.render_sheet_pdf(sheet, total, by_category, count, expenses)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(pdf)
+
+
+def measure(layout: str, sheet: dict, total: float, by_category: dict, expenses: list, db_name: str):
+    # The large layout never sees the expense list, matching generate_pdf
+    payload = expenses if layout == "standard" else None
+    # spawn, not fork, so the child does not inherit the seeded data in its RSS
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(render, layout, sheet, total, by_category, len(expenses), payload, db_name).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ["MONGO_URL"])
+    db_name = f"bench_pdf_{uuid.uuid4().hex[:8]}"
+    db = client[db_name]
+    print(f"storage={server.EXPENSE_STORAGE}")
+    print(f"{'expenses':>10}{'layout':>10}{'render s':>10}{'peak RSS MB':>13}{'pdf KB':>10}")
+    try:
+        for size in args.sizes:
+            sheet, expenses, total, by_category = seed(db, size)
+            for layout in ("standard", "large"):
+                elapsed, peak_mb, pdf_bytes = measure(layout, sheet, total, by_category, expenses, db_name)
+                print(f"{size:>10}{layout:>10}{elapsed:>10.2f}{peak_mb:>13.1f}{pdf_bytes / 1024:>10.0f}")
+    finally:
+        client.drop_database(db_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
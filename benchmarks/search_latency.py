@@ -0,0 +1,130 @@
+"""Expense search latency at 100k expenses per user.
+
+Seeds one user with --expenses expenses spread over monthly sheets, in the
+layout EXPENSE_STORAGE selects, with indexes created by the schema bootstrap.
+Then it times server.find_search_page for type-ahead prefixes, whole words,
+multi-word queries, a date-filtered query and a later page. Each query
+reports p50/p95 against --target-ms. Other users' expenses are seeded too, so
+the index is shared as it is in production. Needs a live MongoDB at MONGO_URL.
+Everything is written to a throwaway database that is dropped afterwards.
+
+    python benchmarks/search_latency.py --expenses 100000 --target-ms 100
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+CATEGORIES = ["Food & Groceries", "Rent/EMI", "Transport & Fuel", "Utilities & Bills", "Entertainment",
+              "Healthcare", "Shopping & Personal", "Other"]
+MERCHANTS = ["Walmart", "Costco", "Target", "Shell", "Chevron", "Starbucks", "Amazon", "Netflix", "Spotify",
+             "Uber", "Lyft", "Walgreens", "CVS", "Kroger", "Safeway", "Trader Joes", "Whole Foods", "IKEA",
+             "Home Depot", "Best Buy", "Apple", "Comcast", "Verizon", "Delta", "Airbnb", "Chipotle"]
+DETAILS = ["groceries", "weekly shop", "fuel", "coffee", "subscription", "ride", "pharmacy", "refund",
+           "furniture", "electronics", "internet bill", "phone bill", "flight", "dinner", "lunch", "snacks"]
+EXPENSES_PER_SHEET = 500
+QUERIES = [
+    ("prefix 2", {"words": ["st"]}),
+    ("prefix 4", {"words": ["star"]}),
+    ("word", {"words": ["groceries"]}),
+    ("two words", {"words": ["whole", "fo"]}),
+    ("rare", {"words": ["airbnb"]}),
+    ("date range", {"words": ["co"], "date_from": "2015-02-01", "date_to": "2015-03-31"}),
+    ("page 3", {"words": ["co"], "page": 3}),
+]
+
+
+def make_expense(rng: random.Random, day: datetime) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "date": day.date().isoformat(),
+        "category": rng.choice(CATEGORIES),
+        "description": f"{rng.choice(MERCHANTS)} {rng.choice(DETAILS)}",
+        "amount": round(rng.uniform(1, 300), 2),
+    }
+
+
+async def seed_user(user_id: str, count: int, rng: random.Random):
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, count, EXPENSES_PER_SHEET):
+        month = start + timedelta(days=31 * (offset // EXPENSES_PER_SHEET))
+        sheet = {
+            "id": str(uuid.uuid4()), "user_id": user_id, "name": month.strftime("%B %Y"),
+            "month": month.strftime("%Y-%m"), "created_at": month, "updated_at": month, "revision": 0,
+        }
+        expenses = [
+            server.stored_expense(make_expense(rng, month + timedelta(days=i % 28)))
+            for i in range(min(EXPENSES_PER_SHEET, count - offset))
+        ]
+        if server.EXPENSE_STORAGE == "collection":
+            await server.db.expenses.insert_many([{**e, "user_id": user_id, "sheet_id": sheet["id"]} for e in expenses])
+            await server.db.expense_sheets.insert_one(sheet)
+        else:
+            await server.db.expense_sheets.insert_one({**sheet, "expenses": expenses})
+        await server.index_expenses(user_id, sheet["id"], expenses)
+
+
+async def timed(user_id: str, repeat: int, limit: int, words: list, date_from=None, date_to=None, page: int = 1):
+    cursor = None
+    for _ in range(page - 1):
+        _, cursor = await server.find_search_page(user_id, words, date_from, date_to, limit, cursor)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits, _ = await server.find_search_page(user_id, words, date_from, date_to, limit, cursor)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[math.ceil(len(samples) * 0.95) - 1], len(hits)
+
+
+async def run(args):
+    motor_client = server.AsyncIOMotorClient(os.environ["MONGO_URL"], tz_aware=True)
+    db_name = f"bench_search_{uuid.uuid4().hex[:8]}"
+    server.db = motor_client[db_name]
+    rng = random.Random(42)
+    try:
+        await server.bootstrap_schema()
+        user_id = "benchmark-user"
+        started = time.perf_counter()
+        await seed_user(user_id, args.expenses, rng)
+        for other in range(args.other_users):
+            await seed_user(f"other-{other}", args.expenses // 10, rng)
+        print(f"storage={server.EXPENSE_STORAGE} expenses={args.expenses} seeded in {time.perf_counter() - started:.0f}s")
+
+        print(f"{'query':>12}{'p50 ms':>10}{'p95 ms':>10}{'hits':>7}  target {args.target_ms:.0f} ms")
+        failed = False
+        for name, query in QUERIES:
+            p50, p95, hits = await timed(user_id, args.repeat, args.limit, **query)
+            failed |= p95 > args.target_ms
+            print(f"{name:>12}{p50:>10.1f}{p95:>10.1f}{hits:>7}  {'ok' if p95 <= args.target_ms else 'OVER'}")
+        print("FAIL" if failed else "PASS")
+    finally:
+        await motor_client.drop_database(db_name)
+        motor_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--expenses", type=int, default=100000)
+    parser.add_argument("--other-users", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--target-ms", type=float, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
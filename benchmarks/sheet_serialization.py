@@ -0,0 +1,97 @@
+"""Sheet response serialization: the response_model path vs. the orjson fast path.
+
+The model path is what get_sheet and the expense mutations used to do: build
+ExpenseSheet from the stored document, let FastAPI validate and serialize it
+again through response_model, and encode with the stdlib json module. The fast
+path is server.sheet_response. No database is needed; documents are built in
+memory in the shape MongoDB returns them.
+
+    python benchmarks/sheet_serialization.py --sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+CATEGORIES = ["Food", "Rent", "Transport", "Utilities", "Entertainment", "Health", "Shopping", "Other"]
+RESPONSE_FIELD = create_response_field(name="Response_get_sheet", type_=server.ExpenseSheet)
+
+
+def make_sheet(count: int) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": "benchmark-user",
+        "name": "Bench",
+        "month": "2024-01",
+        "monthly_salary": 5000.0,
+        "budgets": [{"category": category, "allocated": 500.0} for category in CATEGORIES],
+        "expenses": [
+            {
+                "id": str(uuid.uuid4()),
+                "date": f"2024-01-{i % 28 + 1:02d}",
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "description": f"Transaction {i}",
+                "amount": round((i % 500) + 0.99, 2),
+                "content_hash": uuid.uuid4().hex,
+            }
+            for i in range(count)
+        ],
+        "created_at": now,
+        "updated_at": now,
+        "stats": server.empty_stats(),
+    }
+
+
+async def model_path(sheet: dict) -> bytes:
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=server.ExpenseSheet(**sheet))
+    return JSONResponse(content).body
+
+
+async def fast_path(sheet: dict) -> bytes:
+    return server.sheet_response(sheet).body
+
+
+async def timed(func, sheet: dict, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func(sheet)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(sizes: list, repeat: int):
+    print(f"{'expenses':>10}{'model ms':>11}{'fast ms':>10}{'speedup':>10}{'body KB':>10}")
+    for size in sizes:
+        sheet = make_sheet(size)
+        model_ms = await timed(model_path, sheet, repeat)
+        fast_ms = await timed(fast_path, sheet, repeat)
+        body_kb = len(await fast_path(sheet)) / 1024
+        print(f"{size:>10}{model_ms:>11.2f}{fast_ms:>10.2f}{model_ms / fast_ms:>9.1f}x{body_kb:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
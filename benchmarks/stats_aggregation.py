@@ -0,0 +1,104 @@
+"""Sheet stats: summing in Python vs. the MongoDB aggregation pipeline.
+
+The Python path is what get_stats/compare_sheets/generate_pdf used to do: fetch
+the whole sheet and loop over its expenses. The pipeline path is
+server.aggregate_sheet_stats for both storage modes. Needs a live MongoDB at
+MONGO_URL; everything is written to a throwaway database that is dropped after.
+
+    python benchmarks/stats_aggregation.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from pymongo.errors import DocumentTooLarge  # noqa: E402
+
+CATEGORIES = ["Food", "Rent", "Transport", "Utilities", "Entertainment", "Health", "Shopping", "Other"]
+USER_ID = "benchmark-user"
+
+
+def make_expenses(count: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "date": f"2024-01-{i % 28 + 1:02d}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "description": f"Transaction {i}",
+            "amount": round((i % 500) + 0.99, 2),
+        }
+        for i in range(count)
+    ]
+
+
+async def python_path(sheet_id: str):
+    sheet = await server.db.expense_sheets.find_one({"id": sheet_id, "user_id": USER_ID}, {"_id": 0})
+    expenses = sheet.get("expenses", [])
+    total = sum(e["amount"] for e in expenses)
+    by_category = {}
+    for expense in expenses:
+        by_category[expense["category"]] = by_category.get(expense["category"], 0) + expense["amount"]
+    return total, by_category, len(expenses)
+
+
+async def timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(sizes: list, repeat: int):
+    client = server.AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db_name = f"bench_stats_{uuid.uuid4().hex[:8]}"
+    server.db = client[db_name]
+    print(f"{'expenses':>10}{'python ms':>12}{'embedded pipeline ms':>23}{'collection pipeline ms':>25}")
+    try:
+        for size in sizes:
+            expenses = make_expenses(size)
+            sheet_id = str(uuid.uuid4())
+            await server.db.expenses.insert_many(
+                [{**e, "user_id": USER_ID, "sheet_id": sheet_id} for e in expenses]
+            )
+            try:
+                await server.db.expense_sheets.insert_one(
+                    {"id": sheet_id, "user_id": USER_ID, "name": "Bench", "month": "2024-01", "expenses": expenses}
+                )
+                python_ms = await timed(lambda: python_path(sheet_id), repeat)
+                embedded_ms = await timed(
+                    lambda: server.aggregate_sheet_stats(USER_ID, [sheet_id], "embedded"), repeat
+                )
+                python_col, embedded_col = f"{python_ms:>12.1f}", f"{embedded_ms:>23.1f}"
+            except DocumentTooLarge:
+                python_col, embedded_col = f"{'> 16 MB':>12}", f"{'> 16 MB':>23}"
+
+            collection_ms = await timed(
+                lambda: server.aggregate_sheet_stats(USER_ID, [sheet_id], "collection"), repeat
+            )
+            print(f"{size:>10}{python_col}{embedded_col}{collection_ms:>25.1f}")
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
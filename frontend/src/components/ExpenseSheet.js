@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import axios from 'axios';
@@ -45,15 +45,118 @@ const ExpenseSheet = ({ sheets, onDeleteSheet }) => {
     amount: ''
   });
 
+  // Revision of the sheet as shown; change feed events must follow it in order
+  const revision = useRef(null);
+
   useEffect(() => {
     fetchSheet();
-    fetchStats();
   }, [sheetId]);
 
+  useEffect(() => {
+    // EventSource cannot send the Authorization header, so read the stream with fetch
+    const controller = new AbortController();
+    let retry;
+
+    const listen = async () => {
+      try {
+        const response = await fetch(`${API}/sheets/${sheetId}/events`, {
+          headers: { Authorization: axios.defaults.headers.common['Authorization'] },
+          signal: controller.signal
+        });
+        if (!response.ok) return;
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            if (handleEvent(buffer.slice(0, end)) === 'closed') return;
+            buffer = buffer.slice(end + 2);
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      retry = setTimeout(listen, 3000);
+    };
+
+    listen();
+    return () => {
+      controller.abort();
+      clearTimeout(retry);
+    };
+  }, [sheetId]);
+
+  const handleEvent = (message) => {
+    let type = 'message';
+    let data = '';
+    for (const line of message.split('\n')) {
+      if (line.startsWith('event: ')) type = line.slice(7);
+      else if (line.startsWith('data: ')) data += line.slice(6);
+    }
+    if (!data) return;
+    const payload = JSON.parse(data);
+
+    if (type === 'expense.added' || type === 'expense.updated' || type === 'expense.deleted') {
+      applyChange(payload);
+    } else if (type === 'ready' || type === 'sheet.changed') {
+      if (revision.current !== null && payload.revision !== revision.current) fetchSheet();
+    } else if (type === 'resync') {
+      // The server dropped this stream for falling behind; reload and reconnect
+      fetchSheet();
+    } else if (type === 'sheet.deleted') {
+      setSheet(null);
+      return 'closed';
+    }
+  };
+
+  // Applies an expense change from a view=delta response or the change feed
+  const applyChange = (change) => {
+    if (revision.current === null || change.revision <= revision.current) return;
+    if (change.revision !== revision.current + 1) {
+      // Missed a change in between
+      fetchSheet();
+      return;
+    }
+    revision.current = change.revision;
+    setSheet(current => {
+      const exists = current.expenses.some(e => e.id === change.expense.id);
+      let expenses;
+      if (change.deleted) {
+        expenses = current.expenses.filter(e => e.id !== change.expense.id);
+      } else if (exists) {
+        expenses = current.expenses.map(e => e.id === change.expense.id ? change.expense : e);
+      } else {
+        expenses = [...current.expenses, change.expense];
+      }
+      return { ...current, expenses, revision: change.revision, updated_at: change.updated_at };
+    });
+    setStats(current => current && {
+      ...current,
+      total: change.total,
+      count: change.count,
+      by_category: change.by_category,
+      overspent_categories: change.overspent_categories,
+      remaining_budget: current.remaining_budget + current.total - change.total
+    });
+  };
+
   const fetchSheet = async () => {
     try {
-      const response = await axios.get(`${API}/sheets/${sheetId}`);
-      setSheet(response.data);
+      // Header, stats and the first expenses in one request; larger sheets page in the rest
+      const response = await axios.get(`${API}/sheets/${sheetId}/view`, { params: { limit: 500 } });
+      const { stats: sheetStats, next_cursor: firstCursor, ...view } = response.data;
+      let cursor = firstCursor;
+      while (cursor) {
+        const page = await axios.get(`${API}/sheets/${sheetId}/expenses`, { params: { limit: 500, cursor } });
+        view.expenses.push(...page.data.items);
+        cursor = page.data.next_cursor;
+      }
+      revision.current = view.revision;
+      setSheet(view);
+      setStats(sheetStats);
     } catch (error) {
       toast.error('Failed to load sheet');
     } finally {
@@ -61,15 +164,6 @@ const ExpenseSheet = ({ sheets, onDeleteSheet }) => {
     }
   };
 
-  const fetchStats = async () => {
-    try {
-      const response = await axios.get(`${API}/sheets/${sheetId}/stats`);
-      setStats(response.data);
-    } catch (error) {
-      console.error('Failed to load stats');
-    }
-  };
-
   const handleAddExpense = async () => {
     if (!expenseForm.date || !expenseForm.category || !expenseForm.amount) {
       toast.error('Please fill all required fields');
@@ -77,14 +171,13 @@ const ExpenseSheet = ({ sheets, onDeleteSheet }) => {
     }
 
     try {
-      const response = await axios.post(`${API}/sheets/${sheetId}/expenses`, {
+      const response = await axios.post(`${API}/sheets/${sheetId}/expenses?view=delta`, {
         ...expenseForm,
         amount: parseFloat(expenseForm.amount)
       });
-      setSheet(response.data);
+      applyChange(response.data);
       setExpenseForm({ date: '', category: '', description: '', amount: '' });
       setOpen(false);
-      fetchStats();
       toast.success('Expense added!');
     } catch (error) {
       toast.error('Failed to add expense');
@@ -94,15 +187,14 @@ const ExpenseSheet = ({ sheets, onDeleteSheet }) => {
   const handleUpdateExpense = async (expenseId) => {
     try {
       const expense = sheet.expenses.find(e => e.id === expenseId);
-      const response = await axios.put(`${API}/sheets/${sheetId}/expenses/${expenseId}`, {
+      const response = await axios.put(`${API}/sheets/${sheetId}/expenses/${expenseId}?view=delta`, {
         date: expense.date,
         category: expense.category,
         description: expense.description,
         amount: expense.amount
       });
-      setSheet(response.data);
+      applyChange(response.data);
       setEditingId(null);
-      fetchStats();
       toast.success('Expense updated!');
     } catch (error) {
       toast.error('Failed to update expense');
@@ -111,9 +203,8 @@ const ExpenseSheet = ({ sheets, onDeleteSheet }) => {
 
   const handleDeleteExpense = async (expenseId) => {
     try {
-      const response = await axios.delete(`${API}/sheets/${sheetId}/expenses/${expenseId}`);
-      setSheet(response.data);
-      fetchStats();
+      const response = await axios.delete(`${API}/sheets/${sheetId}/expenses/${expenseId}?view=delta`);
+      applyChange(response.data);
       toast.success('Expense deleted');
     } catch (error) {
       toast.error('Failed to delete expense');
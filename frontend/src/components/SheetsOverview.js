@@ -147,12 +147,12 @@ const SheetsOverview = ({ sheets, onCreateSheet }) => {
 
               <h3 className="text-xl font-bold text-gray-800 mb-2">{sheet.name}</h3>
               <p className="text-gray-600 text-sm">
-                {sheet.expenses?.length || 0} transactions
+                {sheet.count ?? sheet.expenses?.length ?? 0} transactions
               </p>
 
               <div className="mt-4 pt-4 border-t border-gray-200">
                 <p className="text-2xl font-bold text-blue-600">
-                  ${(sheet.expenses || []).reduce((sum, e) => sum + e.amount, 0).toFixed(2)}
+                  ${(sheet.total ?? (sheet.expenses || []).reduce((sum, e) => sum + e.amount, 0)).toFixed(2)}
                 </p>
                 <p className="text-xs text-gray-500 mt-1">Total expenses</p>
               </div>
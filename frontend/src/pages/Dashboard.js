@@ -15,8 +15,16 @@ const Dashboard = ({ user, onLogout }) => {
 
   const fetchSheets = async () => {
     try {
-      const response = await axios.get(`${API}/sheets`);
-      setSheets(response.data);
+      const summaries = [];
+      let cursor = null;
+      do {
+        const response = await axios.get(`${API}/sheets/summary`, {
+          params: { limit: 200, ...(cursor && { cursor }) }
+        });
+        summaries.push(...response.data.items);
+        cursor = response.data.next_cursor;
+      } while (cursor);
+      setSheets(summaries);
     } catch (error) {
       toast.error('Failed to load sheets');
     } finally {
@@ -28,9 +36,9 @@ const Dashboard = ({ user, onLogout }) => {
     fetchSheets();
   }, []);
 
-  const handleCreateSheet = async (name, month) => {
+  const handleCreateSheet = async (name, month, monthly_salary, budgets) => {
     try {
-      const response = await axios.post(`${API}/sheets`, { name, month });
+      const response = await axios.post(`${API}/sheets`, { name, month, monthly_salary, budgets });
       setSheets([response.data, ...sheets]);
       toast.success('Sheet created successfully!');
       navigate(`/sheet/${response.data.id}`);
@@ -0,0 +1,31 @@
+import pytest
+from pydantic import ValidationError
+
+import server
+
+
+def test_overspent_categories_compares_maintained_totals():
+    stats = {"by_category": {
+        "Food": {"total": 13.0, "count": 2},
+        "Rent%2Ex": {"total": 150.0, "count": 1},
+        # Every expense removed: float residue must not count as spending
+        "Gym": {"total": 1e-12, "count": 0},
+    }}
+    allocations = server.budget_allocations([
+        {"category": "Food", "allocated": 20},
+        {"category": "Rent.x", "allocated": 100},
+        {"category": "Gym", "allocated": 0},
+        {"category": "Travel", "allocated": 50},
+    ])
+    assert allocations["Rent%2Ex"] == 100
+    assert server.overspent_categories(stats, allocations) == [
+        {"category": "Rent.x", "budget": 100, "spent": 150.0, "overspent": 50.0}
+    ]
+
+
+def test_budgets_must_be_distinct_and_non_negative():
+    with pytest.raises(ValidationError):
+        server.BudgetUpdate(budgets=[{"category": "Food", "allocated": 1}, {"category": "Food", "allocated": 2}])
+    with pytest.raises(ValidationError):
+        server.ExpenseSheetCreate(name="Jan", month="2024-01", budgets=[{"category": "Food", "allocated": -1}])
+    assert server.ExpenseSheetCreate(name="Jan", month="2024-01").monthly_salary == 0.0
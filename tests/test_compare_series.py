@@ -0,0 +1,23 @@
+import numpy as np
+
+import server
+
+
+def test_series_changes_matches_pairwise_compare():
+    values = np.array([
+        [100.0, 150.0, 0.0, 40.0],
+        [0.0, 0.0, 25.0, 25.0],
+    ])
+    delta, percent = server.series_changes(values)
+    assert delta.tolist() == [[50.0, -150.0, 40.0], [0.0, 25.0, 0.0]]
+    # Growth from zero is reported as 100%, no change from zero as 0%
+    assert percent.tolist() == [[50.0, -100.0, 100.0], [0.0, 100.0, 0.0]]
+
+
+def test_comparison_series_pads_first_point():
+    values = np.array([10.0, 30.0])
+    delta, percent = server.series_changes(values)
+    series = server.comparison_series(values, delta, percent)
+    assert series.values == [10.0, 30.0]
+    assert series.delta == [None, 20.0]
+    assert series.percent_change == [None, 200.0]
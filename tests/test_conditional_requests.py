@@ -0,0 +1,125 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from tests.conftest import MONGO_URL
+
+
+def test_sheets_etag_follows_versions():
+    sheet = {"id": "s1", "updated_at": "2024-01-01T00:00:00+00:00"}
+    etag = server.sheets_etag("sheet", [sheet])
+    assert etag.startswith('W/"')
+    assert server.sheets_etag("sheet", [dict(sheet)]) == etag
+    assert server.sheets_etag("stats", [sheet]) != etag
+    assert server.sheets_etag("sheet", [{**sheet, "updated_at": "2024-01-01T00:00:01+00:00"}]) != etag
+    # Two writes in the same millisecond share updated_at but not revision
+    assert server.sheets_etag("sheet", [{**sheet, "revision": 1}]) != etag
+
+
+def test_etag_matches_uses_weak_comparison():
+    etag = server.sheets_etag("sheet", [{"id": "s1", "updated_at": "t"}])
+    assert server.etag_matches(etag, etag)
+    assert server.etag_matches(f'"other", {etag.removeprefix("W/")}', etag)
+    assert server.etag_matches("*", etag)
+    assert not server.etag_matches('W/"other"', etag)
+    assert not server.etag_matches(None, etag)
+
+
+def test_expected_revision_parses_if_match():
+    assert server.expected_revision(None) is None
+    assert server.expected_revision("*") is None
+    assert server.expected_revision('"7"') == 7
+    assert server.expected_revision('W/"7"') == 7
+    with pytest.raises(server.HTTPException) as excinfo:
+        server.expected_revision('"abc"')
+    assert excinfo.value.status_code == 400
+
+
+def test_sheet_etag_is_accepted_as_if_match(mongo_client):
+    db_name = f"if_match_test_{uuid.uuid4().hex[:8]}"
+    updated_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mongo_client[db_name].expense_sheets.insert_one({"id": "s1", "user_id": "u1", "revision": 4, "updated_at": updated_at})
+    etag = server.sheets_etag("sheet", [{"id": "s1", "revision": 4, "updated_at": updated_at}])
+
+    async def resolve(if_match, sheet_id="s1"):
+        motor_client = server.AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+        original_db, server.db = server.db, motor_client[db_name]
+        try:
+            return await server.if_match_revision(sheet_id, "u1", if_match)
+        finally:
+            server.db = original_db
+            motor_client.close()
+
+    try:
+        # The ETag from GET /sheets/{id} resolves to the revision it was computed from
+        assert asyncio.run(resolve(etag)) == 4
+        assert asyncio.run(resolve(etag.removeprefix("W/"))) == 4
+        assert asyncio.run(resolve('"4"')) == 4
+        assert asyncio.run(resolve(None)) is None
+
+        stale = server.sheets_etag("sheet", [{"id": "s1", "revision": 3, "updated_at": updated_at}])
+        with pytest.raises(server.HTTPException) as excinfo:
+            asyncio.run(resolve(stale))
+        assert excinfo.value.status_code == 409
+        with pytest.raises(server.HTTPException) as excinfo:
+            asyncio.run(resolve(etag, sheet_id="missing"))
+        assert excinfo.value.status_code == 404
+    finally:
+        mongo_client.drop_database(db_name)
+
+
+def test_pinned_collection_writes_bump_revision_once(mongo_client, monkeypatch):
+    db_name = f"if_match_test_{uuid.uuid4().hex[:8]}"
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    mongo_client[db_name].expense_sheets.insert_one({
+        "id": "s1", "user_id": "u1", "month": "2024-01", "revision": 4, "updated_at": now,
+        "stats": {"total": 5.0, "count": 1, "by_category": {"Food": {"total": 5.0, "count": 1}}},
+    })
+    mongo_client[db_name].expenses.insert_one(
+        {"id": "e1", "user_id": "u1", "sheet_id": "s1", "date": now, "category": "Food", "description": "x", "amount": 5.0}
+    )
+    monkeypatch.setattr(server, "EXPENSE_STORAGE", "collection")
+    values = {"date": "2024-01-02", "category": "Food", "description": "y", "amount": 6.0}
+
+    async def scenario():
+        motor_client = server.AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+        original_db, server.db = server.db, motor_client[db_name]
+        try:
+            projection = {"_id": 0, "revision": 1, "user_id": 1, "month": 1}
+            # A pinned write on a missing expense is a 404 that leaves the revision alone
+            assert await server.replace_expense("s1", "u1", "missing", values, projection, 4) is None
+            assert await server.remove_expense("s1", "u1", "missing", projection, 4) is None
+            sheet, _ = await server.replace_expense("s1", "u1", "e1", values, projection, 4)
+            assert sheet["revision"] == 5
+            sheet, _ = await server.remove_expense("s1", "u1", "e1", projection, 5)
+            assert sheet["revision"] == 6
+        finally:
+            server.db = original_db
+            motor_client.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        mongo_client.drop_database(db_name)
+
+
+def test_embedded_write_retries_are_bounded(monkeypatch):
+    attempts = []
+
+    async def find_embedded_expense(sheet_id, user_id, expense_id):
+        attempts.append(expense_id)
+        return 3, {"id": expense_id, "category": "Food", "amount": 1.0}
+
+    async def find_one_and_update(*args, **kwargs):
+        return None  # Another writer always gets there first
+
+    monkeypatch.setattr(server, "find_embedded_expense", find_embedded_expense)
+    monkeypatch.setattr(server, "db", SimpleNamespace(expense_sheets=SimpleNamespace(find_one_and_update=find_one_and_update)))
+    with pytest.raises(server.HTTPException) as excinfo:
+        asyncio.run(server.modify_embedded_expense("s1", "u1", "e1", lambda previous: {}, {}, None))
+    assert excinfo.value.status_code == 503
+    assert len(attempts) == server.EMBEDDED_WRITE_ATTEMPTS
@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+import server
+
+
+def expense(day: int, category: str, amount: float, month: int = 1) -> dict:
+    return {"date": datetime(2024, month, day, tzinfo=timezone.utc), "category": category, "amount": amount}
+
+
+def build(sheets: dict) -> server.ExpenseColumns:
+    columns = server.ExpenseColumns()
+    columns.rebuild({sheet_id: 1 for sheet_id in sheets}, sheets)
+    return columns
+
+
+def test_rebuild_reloads_only_stale_sheets():
+    columns = build({"a": [expense(1, "Food", 1.5)], "b": [expense(2, "Rent", 100), expense(3, "Food", 2)]})
+    assert columns.categories == ["Food", "Rent"]
+    assert columns.spans == {"a": (0, 1), "b": (1, 3)}
+
+    columns.rebuild({"b": 1, "c": 2}, {"c": [expense(9, "Gym", 0.1)]})
+    assert columns.sheet_ids == ["b", "c"]
+    assert columns.cents.tolist() == [10000, 200, 10]
+    assert columns.sheet_index.tolist() == [0, 0, 1]
+
+
+def test_weekly_trends_start_on_monday():
+    # 2024-01-07 is a Sunday, 2024-01-08 a Monday
+    columns = build({"a": [expense(7, "Food", 0.1), expense(8, "Food", 0.2), expense(9, "Rent", 0.1)]})
+    report = server.expense_trends(columns, "week")
+    assert [p["period"] for p in report["periods"]] == ["2024-01-01", "2024-01-08"]
+    assert report["periods"][1]["by_category"] == {"Food": 0.2, "Rent": 0.1}
+    assert report["total"] == 0.4
+    assert report["count"] == 3
+
+
+def test_trend_filters():
+    columns = build({
+        "a": [expense(5, "Food", 10), expense(20, "Rent", 500)],
+        "b": [expense(3, "Food", 7, month=2), {"date": "someday", "category": "Food", "amount": 1}],
+    })
+    monthly = server.expense_trends(columns, "month")
+    # The row with an unparseable date has no period
+    assert [(p["period"], p["count"]) for p in monthly["periods"]] == [("2024-01", 2), ("2024-02", 1)]
+
+    day = server.day_number(datetime(2024, 1, 10, tzinfo=timezone.utc))
+    assert server.expense_trends(columns, "month", day_from=day, categories=["Food"])["total"] == 7
+    assert server.expense_trends(columns, "day", sheet_ids=["a"], categories=["Missing"])["count"] == 0
+    assert server.expense_trends(columns, "day", day_to=day)["periods"][0]["period"] == "2024-01-05"
+
+
+def test_day_number():
+    assert server.day_number(datetime(1970, 1, 2, tzinfo=timezone.utc)) == 1
+    assert server.day_number("1970-01-02") == 1
+    assert server.day_number("garbage") == -1
+    assert np.datetime64(server.day_number("2024-02-29"), "D") == np.datetime64("2024-02-29")
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+def test_cache_hit_costs_one_point_read(monkeypatch):
+    reads = []
+    user = {"data_version": 1}
+    sheet = {"id": "a", "revision": 1, "updated_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+             "expenses": [expense(1, "Food", 1.5)]}
+
+    async def find_user(query, projection):
+        reads.append("user")
+        return dict(user)
+
+    def find_sheets(query, projection):
+        reads.append("sheets")
+        return FakeCursor([dict(sheet)])
+
+    monkeypatch.setattr(server, "EXPENSE_STORAGE", "embedded")
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        users=SimpleNamespace(find_one=find_user), expense_sheets=SimpleNamespace(find=find_sheets)
+    ))
+    cache = server.ExpenseColumnCache(max_bytes=1024)
+
+    def get():
+        reads.clear()
+        return asyncio.run(cache.get("u1"))
+
+    assert get().cents.tolist() == [150]
+    assert reads == ["user", "sheets", "sheets"]
+    assert get().cents.tolist() == [150]
+    assert reads == ["user"]
+
+    # Another write moved data_version: the sheet versions are checked, only changed sheets reload
+    user["data_version"] = 2
+    get()
+    assert reads == ["user", "sheets"]
+    user["data_version"] = 3
+    sheet.update(revision=2, expenses=[expense(1, "Food", 2.5)])
+    assert get().cents.tolist() == [250]
+    assert reads == ["user", "sheets", "sheets"]
+    assert (cache.hits, cache.misses) == (2, 2)
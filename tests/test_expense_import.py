@@ -0,0 +1,63 @@
+import io
+
+import pytest
+from pydantic import ValidationError
+
+import server
+
+OFX = b"""OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240105120000<TRNAMT>-12.50<NAME>Coffee Shop<MEMO>latte</STMTTRN>
+<stmttrn><TRNTYPE>CREDIT<DTPOSTED>20240106<TRNAMT>100.00<NAME>Salary</stmttrn>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240107<TRNAMT>-3<MEMO>Bus fare</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+OFX_ROWS = [
+    (1, {"date": "2024-01-05", "category": "Uncategorized", "description": "Coffee Shop", "amount": "12.50"}),
+    (2, {"error": "Credit transaction, not an expense"}),
+    (3, {"date": "2024-01-07", "category": "Uncategorized", "description": "Bus fare", "amount": "3"}),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 9, 64, 64 * 1024])
+def test_ofx_tags_split_across_chunks(chunk_size):
+    # Small chunks cut <STMTTRN> tags and field values at every possible offset
+    assert list(server.iter_ofx_rows(io.BytesIO(OFX), chunk_size=chunk_size)) == OFX_ROWS
+
+
+def test_ofx_credit_rows_are_errors():
+    credit = b"<STMTTRN><DTPOSTED>20240106<TRNAMT>+5.00<NAME>Refund</STMTTRN>"
+    assert list(server.iter_ofx_rows(io.BytesIO(credit))) == [(1, {"error": "Credit transaction, not an expense"})]
+
+
+def test_ofx_without_transactions():
+    assert list(server.iter_ofx_rows(io.BytesIO(b"<OFX></OFX>"))) == []
+
+
+def test_csv_bom_and_header_case():
+    data = "\ufeff Date ,CATEGORY,Description,Amount\r\n2024-01-02, Food ,Bread,2.50\r\n".encode("utf-8")
+    assert list(server.iter_csv_rows(io.BytesIO(data))) == [
+        (2, {"date": "2024-01-02", "category": "Food", "description": "Bread", "amount": "2.50"})
+    ]
+
+
+def test_csv_short_and_long_rows():
+    data = b"date,category,description,amount\n2024-01-03,Food\n2024-01-04,Food,x,1,extra\n"
+    assert list(server.iter_csv_rows(io.BytesIO(data))) == [
+        (2, {"date": "2024-01-03", "category": "Food", "description": "", "amount": ""}),
+        (3, {"date": "2024-01-04", "category": "Food", "description": "x", "amount": "1"}),
+    ]
+
+
+def test_csv_without_header():
+    assert list(server.iter_csv_rows(io.BytesIO(b""))) == []
+
+
+def test_bad_row_fails_validation():
+    data = b"date,category,description,amount\n2024-01-02,Food,Bread,2.50\n2024-13-01,Food,Milk,abc\n"
+    rows = list(server.iter_csv_rows(io.BytesIO(data)))
+    assert server.ExpenseItemCreate(**rows[0][1]).amount == 2.5
+    with pytest.raises(ValidationError) as e:
+        server.ExpenseItemCreate(**rows[1][1])
+    assert {err["loc"][0] for err in e.value.errors()} == {"date", "amount"}
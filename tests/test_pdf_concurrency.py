@@ -0,0 +1,113 @@
+import socket
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import uvicorn
+
+import server
+from tests.conftest import MONGO_URL
+
+LARGE_SHEET_EXPENSES = 4000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def api_url(mongo_client):
+    """Serve the app with uvicorn on a background thread against a throwaway database."""
+    db_name = f"pdf_test_{uuid.uuid4().hex[:8]}"
+    original_client, original_db = server.client, server.db
+    server.client = server.AsyncIOMotorClient(MONGO_URL)
+    server.db = server.client[db_name]
+
+    port = free_port()
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=uvicorn_server.run, daemon=True)
+    thread.start()
+    while not uvicorn_server.started:
+        time.sleep(0.05)
+
+    yield f"http://127.0.0.1:{port}/api"
+
+    uvicorn_server.should_exit = True
+    thread.join(timeout=10)
+    server.client, server.db = original_client, original_db
+    mongo_client.drop_database(db_name)
+
+
+def new_user(api_url):
+    response = requests.post(f"{api_url}/auth/register", json={
+        "email": f"pdf_{uuid.uuid4().hex[:8]}@example.com",
+        "password": "TestPass123!",
+        "name": "PDF Test"
+    })
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def new_sheet(api_url, headers, expenses=0):
+    response = requests.post(f"{api_url}/sheets", headers=headers, json={
+        "name": "PDF Test", "month": "2024-01", "monthly_salary": 5000
+    })
+    response.raise_for_status()
+    sheet_id = response.json()["id"]
+    if expenses:
+        rows = [
+            {"date": f"2024-01-{i % 28 + 1:02d}", "category": f"Category {i % 9}",
+             "description": f"Transaction number {i}", "amount": i % 300 + 0.5}
+            for i in range(expenses)
+        ]
+        requests.post(f"{api_url}/sheets/{sheet_id}/expenses/bulk", headers=headers, json=rows).raise_for_status()
+    return sheet_id
+
+
+def sheets_latency(api_url, headers):
+    started = time.perf_counter()
+    requests.get(f"{api_url}/sheets", headers=headers).raise_for_status()
+    return time.perf_counter() - started
+
+
+def test_sheet_listing_latency_stays_flat_while_pdfs_render(api_url, monkeypatch):
+    monkeypatch.setattr(server, "PDF_MAX_PER_USER", 4)
+    reporter = new_user(api_url)
+    large_sheet = new_sheet(api_url, reporter, expenses=LARGE_SHEET_EXPENSES)
+    browser = new_user(api_url)
+    new_sheet(api_url, browser, expenses=20)
+
+    baseline = statistics.median(sheets_latency(api_url, browser) for _ in range(20))
+
+    with ThreadPoolExecutor(max_workers=4) as renders:
+        pdfs = [
+            renders.submit(requests.get, f"{api_url}/sheets/{large_sheet}/pdf", headers=reporter)
+            for _ in range(4)
+        ]
+        during = []
+        while not all(pdf.done() for pdf in pdfs):
+            during.append(sheets_latency(api_url, browser))
+
+    assert all(pdf.result().status_code == 200 for pdf in pdfs)
+    assert during, "PDFs finished before any listing request was measured"
+    # Blocking renders would push listing latency to whole seconds
+    assert statistics.median(during) < max(baseline * 5, 0.25)
+
+
+def test_second_concurrent_pdf_for_same_user_is_rejected(api_url):
+    reporter = new_user(api_url)
+    large_sheet = new_sheet(api_url, reporter, expenses=LARGE_SHEET_EXPENSES)
+
+    with ThreadPoolExecutor(max_workers=2) as renders:
+        first = renders.submit(requests.get, f"{api_url}/sheets/{large_sheet}/pdf", headers=reporter)
+        time.sleep(0.2)
+        second = requests.get(f"{api_url}/sheets/{large_sheet}/pdf", headers=reporter)
+
+    assert first.result().status_code == 200
+    assert second.status_code == 429
@@ -0,0 +1,120 @@
+import asyncio
+import uuid
+
+import pytest
+
+import server
+from tests.conftest import MONGO_URL
+
+
+def run_bootstrap(db_name):
+    """Run server.bootstrap_schema against a throwaway database on its own event loop."""
+    async def bootstrap():
+        motor_client = server.AsyncIOMotorClient(MONGO_URL)
+        original_db, server.db = server.db, motor_client[db_name]
+        try:
+            return await server.bootstrap_schema()
+        finally:
+            server.db = original_db
+            motor_client.close()
+
+    return asyncio.run(bootstrap())
+
+
+@pytest.fixture
+def bootstrapped_db(mongo_client):
+    db_name = f"schema_test_{uuid.uuid4().hex[:8]}"
+    version = run_bootstrap(db_name)
+    try:
+        yield mongo_client[db_name], version
+    finally:
+        mongo_client.drop_database(db_name)
+
+
+def winning_index(plan):
+    """Return the index name used by the winning plan, or None for a collection scan."""
+    stage = plan["queryPlanner"]["winningPlan"]
+    while stage:
+        if stage.get("stage") == "IXSCAN":
+            return stage["indexName"]
+        if stage.get("stage") == "COLLSCAN":
+            return None
+        stage = stage.get("inputStage") or (stage.get("inputStages") or [None])[0]
+    return None
+
+
+def test_bootstrap_records_version(bootstrapped_db):
+    db, version = bootstrapped_db
+    state = db.schema_version.find_one({"_id": "schema"})
+    assert version == server.SCHEMA_VERSION
+    assert state["version"] == server.SCHEMA_VERSION
+    assert state["pending"] is None
+
+
+def test_bootstrap_is_idempotent(bootstrapped_db):
+    db, _ = bootstrapped_db
+    assert run_bootstrap(db.name) == server.SCHEMA_VERSION
+
+
+def test_refuses_half_applied_migration(bootstrapped_db):
+    db, _ = bootstrapped_db
+    db.schema_version.update_one(
+        {"_id": "schema"},
+        {"$set": {"pending": server.SCHEMA_VERSION, "pending_since": "2000-01-01T00:00:00+00:00"}},
+    )
+    with pytest.raises(RuntimeError, match="never completed"):
+        run_bootstrap(db.name)
+
+
+def test_waits_for_a_migration_that_outlives_its_lease(bootstrapped_db, monkeypatch):
+    db, version = bootstrapped_db
+    runs = []
+
+    async def slow_migration():
+        runs.append(1)
+        await asyncio.sleep(3)
+
+    monkeypatch.setattr(server, "SCHEMA_MIGRATIONS", server.SCHEMA_MIGRATIONS + [(version + 1, "slow", slow_migration)])
+    monkeypatch.setattr(server, "SCHEMA_VERSION", version + 1)
+    monkeypatch.setattr(server, "SCHEMA_MIGRATION_LEASE_SECONDS", 1)
+    monkeypatch.setattr(server, "SCHEMA_MIGRATION_HEARTBEAT_SECONDS", 0.2)
+
+    async def two_workers():
+        motor_client = server.AsyncIOMotorClient(MONGO_URL)
+        original_db, server.db = server.db, motor_client[db.name]
+        try:
+            # The second worker keeps waiting as long as the first one's heartbeat is fresh
+            return await asyncio.gather(server.bootstrap_schema(), server.bootstrap_schema())
+        finally:
+            server.db = original_db
+            motor_client.close()
+
+    assert asyncio.run(two_workers()) == [version + 1, version + 1]
+    assert len(runs) == 1
+    state = db.schema_version.find_one({"_id": "schema"})
+    assert state["pending"] is None and "heartbeat_at" not in state
+
+
+@pytest.mark.parametrize(
+    "collection, query, sort, expected",
+    [
+        ("users", {"email": "a@example.com"}, None, "email_unique"),
+        ("users", {"id": "u1"}, None, "id_unique"),
+        ("expense_sheets", {"id": "s1", "user_id": "u1"}, None, "id_user"),
+        ("expense_sheets", {"user_id": "u1"}, [("created_at", -1), ("id", -1)], "user_created_at_id"),
+        ("rollups", {"user_id": "u1", "month": {"$gte": "2023-01", "$lte": "2024-12"}}, [("month", 1)], "user_month_category"),
+    ],
+)
+def test_query_plans_use_indexes(bootstrapped_db, collection, query, sort, expected):
+    db, _ = bootstrapped_db
+    # Seed enough documents that the planner has real candidates to rank
+    db.users.insert_many(
+        {"id": f"u{i}", "email": f"user{i}@example.com", "name": "User"} for i in range(50)
+    )
+    db.expense_sheets.insert_many(
+        {"id": f"s{i}", "user_id": f"u{i % 5}", "created_at": f"2024-01-{i % 28 + 1:02d}"} for i in range(200)
+    )
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    assert winning_index(cursor.explain()) == expected
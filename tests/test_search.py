@@ -0,0 +1,26 @@
+import server
+
+
+def test_search_words_are_lowercased_deduplicated_and_capped():
+    words = server.search_words("Café CAFE x " + "a" * 30)
+    assert words == ["café", "cafe", "a" * server.SEARCH_MAX_WORD_LENGTH]
+
+
+def test_terms_cover_every_prefix_and_whole_words():
+    terms = server.search_terms({"description": "Gas", "category": "Transport & Fuel"})
+    assert "=gas" in terms and "=fuel" in terms
+    assert {"ga", "gas", "tr", "trans", "transport", "fu", "fuel"} <= set(terms)
+    # Single letters and the separator are not indexed
+    assert "g" not in terms and "&" not in terms
+
+
+def test_search_entry_keys_the_expense_and_keeps_terms_out_of_it():
+    stored = server.stored_expense(
+        {"id": "e1", "date": "2024-01-02", "category": "Food", "description": "Bakery", "amount": 3.5}
+    )
+    assert "terms" not in stored and "search_terms" not in stored
+    entry = server.search_entry("u1", "s1", stored)
+    assert {key: entry[key] for key in ("user_id", "sheet_id", "expense_id", "date")} == {
+        "user_id": "u1", "sheet_id": "s1", "expense_id": "e1", "date": stored["date"]
+    }
+    assert entry["terms"] == server.search_terms(stored)
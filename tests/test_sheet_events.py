@@ -0,0 +1,46 @@
+import asyncio
+
+import orjson
+
+import server
+
+
+def test_events_fan_out_per_sheet():
+    async def scenario():
+        hub = server.SheetEventHub(queue_size=4)
+        first, second, other = hub.subscribe("a"), hub.subscribe("a"), hub.subscribe("b")
+        await hub.publish("a", "expense.added", {"revision": 1})
+        assert first.get_nowait() == second.get_nowait() == {"type": "expense.added", "data": {"revision": 1}}
+        assert other.empty()
+
+        hub.unsubscribe("a", first)
+        hub.unsubscribe("a", second)
+        assert "a" not in hub.subscribers
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_dropped_with_resync():
+    async def scenario():
+        hub = server.SheetEventHub(queue_size=2)
+        slow, fast = hub.subscribe("a"), hub.subscribe("a")
+        for revision in range(1, 4):
+            await hub.publish("a", "expense.added", {"revision": revision})
+            while not fast.empty():
+                assert fast.get_nowait()["data"]["revision"] == revision
+
+        # The backlog is discarded and the stream ends on resync
+        assert slow.qsize() == 1
+        assert slow.get_nowait()["type"] == "resync"
+        assert hub.subscribers["a"] == {fast}
+        assert hub.stats()["dropped"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_sse_message_uses_revision_as_id():
+    message = server.sse_message({"type": "expense.deleted", "data": {"revision": 7, "deleted": True}})
+    head, data = message.split(b"data: ")
+    assert head == b"id: 7\nevent: expense.deleted\n"
+    assert orjson.loads(data) == {"revision": 7, "deleted": True}
+    assert server.sse_message({"type": "resync", "data": {}}) == b"event: resync\ndata: {}\n\n"
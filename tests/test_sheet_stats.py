@@ -0,0 +1,81 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from tests.conftest import MONGO_URL
+
+
+@pytest.mark.parametrize("category", ["Food", "", "Rent.EMI", "$cash", "100%", "%00", "%2E", "a.b$c%d"])
+def test_category_key_round_trips(category):
+    key = server.category_key(category)
+    assert key and "." not in key and not key.startswith("$")
+    assert server.category_name(key) == category
+
+
+def test_category_keys_are_distinct():
+    categories = ["", "%00", ".", "%2E", "$", "%24", "%", "%25"]
+    assert len({server.category_key(category) for category in categories}) == len(categories)
+
+
+def test_stats_delta_combines_changes():
+    old = {"category": "Food", "amount": 10.0}
+    new = {"category": "Rent.EMI", "amount": 25.0}
+    assert server.stats_delta((old, -1), (new, 1)) == {
+        "stats.total": 15.0,
+        "stats.count": 0,
+        "stats.by_category.Food.total": -10.0,
+        "stats.by_category.Food.count": -1,
+        "stats.by_category.Rent%2EEMI.total": 25.0,
+        "stats.by_category.Rent%2EEMI.count": 1,
+    }
+
+
+def test_stats_delta_paths_have_no_empty_segments():
+    delta = server.stats_delta(({"category": "", "amount": 3.0}, 1), ({"category": "", "amount": 2.0}, 1))
+    assert all("" not in path.split(".") for path in delta)
+    assert delta["stats.by_category.%00.total"] == 5.0
+    assert delta["stats.by_category.%00.count"] == 2
+
+
+def test_read_stats_decodes_keys():
+    stats = server.empty_stats()
+    stats["by_category"] = {"%00": {"total": 5.0, "count": 2}, "Gone": {"total": 0.0, "count": 0}}
+    assert server.read_stats({"stats": stats}) == (0.0, {"": 5.0}, 0)
+
+
+def test_repair_works_through_sheets_in_batches(mongo_client, monkeypatch):
+    db_name = f"stats_test_{uuid.uuid4().hex[:8]}"
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    correct = {"total": 2.0, "count": 1, "by_category": {"Food": {"total": 2.0, "count": 1}}}
+    mongo_client[db_name].expense_sheets.insert_many([
+        {
+            "id": f"s{i}", "user_id": f"u{i % 2}", "updated_at": now,
+            "stats": None if i % 3 == 0 else correct if i % 3 == 1 else {**correct, "total": 9.0},
+            "expenses": [{"id": f"e{i}", "date": now, "category": "Food", "description": "x", "amount": 2.0}],
+        }
+        for i in range(7)
+    ])
+    monkeypatch.setattr(server, "STATS_REPAIR_BATCH_SIZE", 2)
+
+    async def repair(dry_run):
+        motor_client = server.AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+        original_db, server.db = server.db, motor_client[db_name]
+        try:
+            return await server.repair_sheet_stats(dry_run=dry_run)
+        finally:
+            server.db = original_db
+            motor_client.close()
+
+    try:
+        drifted = ["s0", "s2", "s3", "s5", "s6"]
+        assert asyncio.run(repair(dry_run=True)) == {"checked": 7, "drifted": 5, "sheets": drifted}
+        assert mongo_client[db_name].expense_sheets.count_documents({"stats": None}) == 3
+        assert asyncio.run(repair(dry_run=False))["sheets"] == drifted
+        for sheet in mongo_client[db_name].expense_sheets.find():
+            assert sheet["stats"] == correct
+        assert asyncio.run(repair(dry_run=False))["drifted"] == 0
+    finally:
+        mongo_client.drop_database(db_name)
@@ -0,0 +1,40 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_fields_default_to_every_section():
+    assert server.parse_view_fields(None) == server.SHEET_VIEW_FIELDS
+
+
+def test_fields_mix_sections_and_single_fields():
+    selected = server.parse_view_fields("stats.total, header.name,expenses,header.month,stats.total")
+    assert selected == {
+        "header": ["name", "month"],
+        "expenses": ["date", "category", "description", "amount"],
+        "stats": ["total"],
+    }
+
+
+@pytest.mark.parametrize("fields", ["secret", "header.user_id", "expenses.content_hash", "header."])
+def test_unknown_fields_are_rejected(fields):
+    with pytest.raises(HTTPException) as error:
+        server.parse_view_fields(fields)
+    assert error.value.status_code == 400
+
+
+def test_projection_reads_only_what_the_fields_need():
+    projection = server.sheet_view_projection(server.parse_view_fields("header.name,stats.remaining_budget"))
+    assert projection == {"_id": 0, "id": 1, "user_id": 1, "name": 1, "stats": 1, "monthly_salary": 1}
+    assert "expenses" not in server.sheet_view_projection(server.parse_view_fields("header,stats"))
+
+
+def test_view_model_documents_every_field():
+    fields = server.SHEET_VIEW_FIELDS
+    assert set(server.SheetView.model_fields) == {"id", *fields["header"], "expenses", "next_cursor", "stats"}
+    assert set(server.SheetViewExpense.model_fields) == {"id", *fields["expenses"]}
+    assert set(server.SheetViewStats.model_fields) == set(fields["stats"])
+
+    responses = server.app.openapi()["paths"]["/api/sheets/{sheet_id}/view"]["get"]["responses"]
+    assert responses["200"]["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/SheetView"}
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+import requests
+import uvicorn
+
+import server
+from tests.conftest import MONGO_URL
+from tests.test_pdf_concurrency import free_port
+
+CREATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+LEGACY_SHEETS = {
+    "s1": ("2024-01", [("Food", 10.0), ("Rent", 500.0)]),
+    "s2": ("2024-01", [("Food", 5.5)]),
+    "s3": ("2024-02", [("Food", 7.0)]),
+}
+
+
+@pytest.fixture
+def legacy_db(mongo_client):
+    """A database written by the embedded layout before stats, hashes and rollups existed."""
+    db_name = f"storage_test_{uuid.uuid4().hex[:8]}"
+    db = mongo_client[db_name]
+    db.users.insert_one({"id": "u1", "email": "u1@example.com", "name": "U1", "created_at": CREATED_AT})
+    db.expense_sheets.insert_many([
+        {
+            "id": sheet_id, "user_id": "u1", "name": month, "month": month, "monthly_salary": 0, "budgets": [],
+            "created_at": CREATED_AT, "updated_at": CREATED_AT,
+            "expenses": [
+                {"id": f"{sheet_id}-{i}", "date": f"{month}-0{i + 1}", "category": category,
+                 "description": f"{category} {i}", "amount": amount}
+                for i, (category, amount) in enumerate(expenses)
+            ],
+        }
+        for sheet_id, (month, expenses) in LEGACY_SHEETS.items()
+    ])
+    try:
+        yield db
+    finally:
+        mongo_client.drop_database(db_name)
+
+
+@contextmanager
+def serve(db_name, storage, monkeypatch):
+    """Start the app, startup hooks included, with the given EXPENSE_STORAGE."""
+    monkeypatch.setattr(server, "EXPENSE_STORAGE", storage)
+    monkeypatch.setattr(server, "client", server.AsyncIOMotorClient(MONGO_URL, tz_aware=True))
+    monkeypatch.setattr(server, "db", server.client[db_name])
+    server.user_cache.clear()
+
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, port=free_port(), log_level="warning"))
+    thread = threading.Thread(target=uvicorn_server.run, daemon=True)
+    thread.start()
+    while not uvicorn_server.started and thread.is_alive():
+        time.sleep(0.05)
+    assert uvicorn_server.started, "startup failed"
+    try:
+        yield f"http://127.0.0.1:{uvicorn_server.config.port}/api"
+    finally:
+        uvicorn_server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def migrate(db_name):
+    motor_client = server.AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+    original_db, server.db = server.db, motor_client[db_name]
+    try:
+        return await server.migrate_embedded_expenses()
+    finally:
+        server.db = original_db
+        motor_client.close()
+
+
+def auth_headers():
+    return {"Authorization": f"Bearer {server.create_access_token({'sub': 'u1'})}"}
+
+
+def test_rollups_of_embedded_data_booted_in_collection_mode(legacy_db, monkeypatch):
+    # The rollups backfill runs before the embedded arrays are moved over
+    with serve(legacy_db.name, "collection", monkeypatch) as api_url:
+        response = requests.get(f"{api_url}/analytics/rollups", headers=auth_headers())
+    response.raise_for_status()
+    report = response.json()
+    assert report["count"] == 4
+    assert report["total"] == pytest.approx(522.5)
+    assert {period["period"]: period["by_category"] for period in report["periods"]} == {
+        "2024-01": {"Food": pytest.approx(15.5), "Rent": pytest.approx(500.0)},
+        "2024-02": {"Food": pytest.approx(7.0)},
+    }
+
+
+def legacy_expenses():
+    return {
+        f"{sheet_id}-{i}": (sheet_id, category, amount)
+        for sheet_id, (_, expenses) in LEGACY_SHEETS.items()
+        for i, (category, amount) in enumerate(expenses)
+    }
+
+
+def test_switch_to_collection_storage_keeps_expenses_and_totals(legacy_db, monkeypatch):
+    with serve(legacy_db.name, "collection", monkeypatch) as api_url:
+        headers = auth_headers()
+        sheets = {sheet_id: requests.get(f"{api_url}/sheets/{sheet_id}", headers=headers).json() for sheet_id in LEGACY_SHEETS}
+        stats = {sheet_id: requests.get(f"{api_url}/sheets/{sheet_id}/stats", headers=headers).json() for sheet_id in LEGACY_SHEETS}
+        rollups = requests.get(f"{api_url}/analytics/rollups", headers=headers).json()
+
+    # Every expense moved over once, and the embedded arrays were cleared
+    moved = {
+        expense["id"]: (expense["sheet_id"], expense["category"], expense["amount"])
+        for expense in legacy_db.expenses.find()
+    }
+    assert moved == legacy_expenses()
+    assert legacy_db.expense_sheets.count_documents({"expenses.0": {"$exists": True}}) == 0
+
+    for sheet_id, (_, expenses) in LEGACY_SHEETS.items():
+        assert sorted((e["category"], e["amount"]) for e in sheets[sheet_id]["expenses"]) == sorted(expenses)
+        assert stats[sheet_id]["total"] == pytest.approx(sum(amount for _, amount in expenses))
+        assert stats[sheet_id]["count"] == len(expenses)
+    assert rollups["total"] == pytest.approx(sum(stat["total"] for stat in stats.values()))
+    assert rollups["count"] == len(legacy_expenses())
+
+
+def test_storage_migration_is_idempotent(legacy_db, monkeypatch):
+    with serve(legacy_db.name, "collection", monkeypatch):
+        pass
+    stats = {sheet["id"]: sheet["stats"] for sheet in legacy_db.expense_sheets.find()}
+    rollups = list(legacy_db.rollups.find({}, {"_id": 0}).sort([("month", 1), ("category", 1)]))
+
+    # A second start, and a direct rerun, find nothing left to move
+    with serve(legacy_db.name, "collection", monkeypatch):
+        pass
+    assert asyncio.run(migrate(legacy_db.name)) == 0
+    assert legacy_db.expenses.count_documents({}) == len(legacy_expenses())
+    assert {sheet["id"]: sheet["stats"] for sheet in legacy_db.expense_sheets.find()} == stats
+    assert list(legacy_db.rollups.find({}, {"_id": 0}).sort([("month", 1), ("category", 1)])) == rollups
+
+
+def test_interrupted_storage_migration_resumes(legacy_db, monkeypatch):
+    # A run that copied a sheet's expenses but died before clearing its array
+    legacy_db.expenses.insert_one({
+        "id": "s1-0", "user_id": "u1", "sheet_id": "s1", "date": "2024-01-01",
+        "category": "Food", "description": "Food 0", "amount": 10.0,
+    })
+    monkeypatch.setattr(server, "EXPENSE_STORAGE", "collection")
+    assert asyncio.run(migrate(legacy_db.name)) == len(legacy_expenses())
+    assert legacy_db.expenses.count_documents({}) == len(legacy_expenses())
+
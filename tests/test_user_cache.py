@@ -0,0 +1,77 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_user(user_id):
+    return server.User(id=user_id, email=f"{user_id}@example.com", name=user_id)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = server.UserCache(max_size=4, ttl_seconds=60)
+    user = make_user("u1")
+    cache.put(user)
+    clock[0] += 60
+    assert cache.get("u1") is user
+    clock[0] += 0.001
+    assert cache.get("u1") is None
+    # The expired entry is dropped, not kept around until evicted
+    assert cache.stats()["size"] == 0
+
+
+def test_put_refreshes_ttl(clock):
+    cache = server.UserCache(max_size=4, ttl_seconds=60)
+    cache.put(make_user("u1"))
+    clock[0] += 50
+    cache.put(make_user("u1"))
+    clock[0] += 50
+    assert cache.get("u1") is not None
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = server.UserCache(max_size=2, ttl_seconds=60)
+    cache.put(make_user("u1"))
+    cache.put(make_user("u2"))
+    assert cache.get("u1") is not None
+    cache.put(make_user("u3"))
+    assert cache.get("u2") is None
+    assert cache.get("u1") is not None
+    assert cache.get("u3") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_invalidate_and_clear(clock):
+    cache = server.UserCache(max_size=4, ttl_seconds=60)
+    cache.put(make_user("u1"))
+    cache.put(make_user("u2"))
+    cache.invalidate("u1")
+    cache.invalidate("missing")
+    assert cache.get("u1") is None
+    assert cache.get("u2") is not None
+    cache.clear()
+    assert cache.get("u2") is None
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = server.UserCache(max_size=4, ttl_seconds=60, enabled=False)
+    cache.put(make_user("u1"))
+    assert cache.get("u1") is None
+    assert cache.stats() == {"enabled": False, "size": 0, "max_size": 4, "hits": 0, "misses": 0}
+
+
+def test_hits_and_misses_are_counted(clock):
+    cache = server.UserCache(max_size=4, ttl_seconds=60)
+    assert cache.get("u1") is None
+    cache.put(make_user("u1"))
+    cache.get("u1")
+    cache.get("u1")
+    clock[0] += 61
+    cache.get("u1")
+    assert cache.stats() == {"enabled": True, "size": 0, "max_size": 4, "hits": 2, "misses": 2}